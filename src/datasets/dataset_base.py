@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from torch.utils.data import Dataset
 
 from overrides import overrides
@@ -16,5 +18,8 @@ class DatasetBase(Dataset):
     def use_collate_function(self) -> bool:
         return False
 
+    def get_item_lengths(self) -> Optional[List[int]]:
+        return None
+
     def collate_function(self, sequences):
         pass
@@ -0,0 +1,22 @@
+from torch.utils.data import DataLoader
+
+
+class DeviceDataLoader(DataLoader):
+    """
+    Data loader which moves every batch to the device in the main process.
+    This allows the batches to be created on the CPU inside worker processes,
+    while the copies to the device can be done without blocking when the memory is pinned.
+    """
+
+    def __init__(self, *args, device: str = 'cpu', **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._device = device
+        self._non_blocking = self.pin_memory
+
+    def __iter__(self):
+        for batch in super().__iter__():
+            if hasattr(batch, 'to'):
+                batch = batch.to(self._device, non_blocking=self._non_blocking)
+
+            yield batch
@@ -0,0 +1,109 @@
+from typing import Iterator, List
+
+import numpy as np
+
+from torch.utils.data import Sampler
+
+from services.log_service import LogService
+
+
+class LengthBucketBatchSampler(Sampler):
+    """
+    Groups items of similar length into the same batches, so that less of every batch is padding.
+    Every epoch the items are shuffled and split into pools of `pool_size_multiplier` batches.
+    Each pool is sorted by length and split into batches, and the order of all batches is shuffled.
+    The shuffling depends only on the epoch, so the batches of an epoch can be counted before iterating them
+    """
+
+    def __init__(
+            self,
+            item_lengths: np.ndarray,
+            batch_size: int,
+            log_service: LogService,
+            max_batch_tokens: int = None,
+            pool_size_multiplier: int = 50):
+        self._item_lengths = np.asarray(item_lengths, dtype=np.int64)
+        self._batch_size = batch_size
+        self._log_service = log_service
+        self._max_batch_tokens = max_batch_tokens
+        self._pool_size = batch_size * pool_size_multiplier
+
+        # drawn from the global generator, so that the batches follow the seed of the run
+        self._seed = int(np.random.randint(np.iinfo(np.int32).max))
+        self._epoch = 0
+
+    def set_epoch(self, epoch: int):
+        """Set the epoch whose batches are returned by the next iteration
+
+        :param epoch: The epoch
+        :type epoch: int
+        """
+        self._epoch = epoch
+
+    def __iter__(self) -> Iterator[List[int]]:
+        batches = self._create_batches(self._epoch)
+        self._epoch += 1
+
+        self._log_padding_efficiency(batches)
+
+        for batch in batches:
+            yield batch
+
+    def __len__(self) -> int:
+        # the amount of batches of the next epoch, which depends on the grouping when batches are capped by tokens
+        if self._max_batch_tokens is None:
+            pool_sizes = [
+                min(self._pool_size, len(self._item_lengths) - pool_start)
+                for pool_start in range(0, len(self._item_lengths), self._pool_size)
+            ]
+
+            return sum([-(-pool_size // self._batch_size) for pool_size in pool_sizes])
+
+        return len(self._create_batches(self._epoch))
+
+    def _create_batches(self, epoch: int) -> List[List[int]]:
+        random_generator = np.random.default_rng([self._seed, epoch])
+        indices = random_generator.permutation(len(self._item_lengths))
+
+        batches = []
+        for pool_start in range(0, len(indices), self._pool_size):
+            pool = indices[pool_start:pool_start + self._pool_size]
+            pool = pool[np.argsort(self._item_lengths[pool], kind='stable')]
+            batches.extend(self._split_pool(pool))
+
+        batches = [batches[i] for i in random_generator.permutation(len(batches))]
+        return batches
+
+    def _split_pool(self, pool: np.ndarray) -> List[List[int]]:
+        if self._max_batch_tokens is None:
+            return [
+                pool[i:i + self._batch_size].tolist()
+                for i in range(0, len(pool), self._batch_size)
+            ]
+
+        # the pool is sorted, so the last item of a batch is the one all others are padded to
+        batches = []
+        current_batch = []
+        for idx, item_length in zip(pool.tolist(), self._item_lengths[pool].tolist()):
+            if len(current_batch) > 0 and (len(current_batch) + 1) * item_length > self._max_batch_tokens:
+                batches.append(current_batch)
+                current_batch = []
+
+            current_batch.append(idx)
+
+        if len(current_batch) > 0:
+            batches.append(current_batch)
+
+        return batches
+
+    def _log_padding_efficiency(self, batches: List[List[int]]):
+        item_tokens = 0
+        padded_tokens = 0
+        for batch in batches:
+            batch_lengths = self._item_lengths[batch]
+            item_tokens += int(batch_lengths.sum())
+            padded_tokens += int(batch_lengths.max()) * len(batch)
+
+        padding_efficiency = item_tokens / padded_tokens if padded_tokens > 0 else 1.0
+        self._log_service.log_info(
+            f'Length bucketed batches: {len(batches)} batches, {item_tokens} tokens, {padded_tokens} tokens with padding [padding efficiency: {padding_efficiency:.3f}]')
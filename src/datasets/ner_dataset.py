@@ -20,6 +20,7 @@ from enums.language import Language
 from services.arguments.ner_arguments_service import NERArgumentsService
 from services.vocabulary_service import VocabularyService
 from services.process.ner_process_service import NERProcessService
+from services.pretrained_features_service import PretrainedFeaturesService
 
 
 class NERDataset(DatasetBase):
@@ -28,6 +29,7 @@ class NERDataset(DatasetBase):
             arguments_service: NERArgumentsService,
             vocabulary_service: VocabularyService,
             process_service: NERProcessService,
+            pretrained_features_service: PretrainedFeaturesService,
             log_service: LogService,
             run_type: RunType):
         super().__init__()
@@ -37,51 +39,165 @@ class NERDataset(DatasetBase):
         self._arguments_service = arguments_service
         self._log_service = log_service
 
-        self._device = arguments_service.device
         self._include_pretrained = arguments_service.include_pretrained_model
+        self._include_targets = arguments_service.evaluate or run_type != RunType.Test
+        self._pad_idx = process_service.pad_idx
 
         self.ne_collection = process_service.get_processed_data(run_type)
 
         self._run_type = run_type
 
+        self._materialize_collection()
+
+        # the representations of a frozen pre-trained model are read from a cache instead of computed every batch
+        self._pretrained_features = None
+        if pretrained_features_service.use_pretrained_features():
+            self._pretrained_features = pretrained_features_service.get_pretrained_features(
+                run_type,
+                self._token_ids,
+                self._token_ids_offsets)
+
         print(f'Loaded {len(self.ne_collection)} items for \'{run_type}\' set')
 
     @overrides
     def __len__(self):
-        return len(self.ne_collection)
+        return len(self._document_ids)
+
+    def __getstate__(self):
+        # the items and the collate function only need the materialized arrays,
+        # so the services and the collection are not copied to data loader workers
+        state = self.__dict__.copy()
+        for key in ['_process_service', '_vocabulary_service', '_arguments_service', '_log_service', 'ne_collection']:
+            state[key] = None
+
+        return state
 
     @overrides
     def __getitem__(self, idx):
-        item: NELine = self.ne_collection[idx]
+        token_ids = self._slice_array(self._token_ids, self._token_ids_offsets, idx)
 
         entity_labels = []
-        if self._arguments_service.evaluate or self._run_type != RunType.Test:
-            entity_labels = self._process_service.get_entity_labels(item, ignore_unknown=(self._run_type == RunType.Test))
+        if self._entity_labels is not None:
+            entity_labels = {
+                entity_tag_type: self._slice_array(labels, self._entity_labels_offsets[entity_tag_type], idx)
+                for entity_tag_type, labels in self._entity_labels.items()
+            }
+
+        tokens_start, tokens_end = self._characters_offsets[idx], self._characters_offsets[idx + 1]
+        token_character_offsets = self._token_character_offsets[tokens_start:tokens_end + 1]
+        line_characters = self._characters[token_character_offsets[0]:token_character_offsets[-1]].tolist()
+        token_character_offsets = (token_character_offsets - token_character_offsets[0]).tolist()
+        character_sequence = [
+            line_characters[start:end]
+            for start, end in zip(token_character_offsets[:-1], token_character_offsets[1:])
+        ]
+        token_characters = [end - start for start, end in zip(token_character_offsets[:-1], token_character_offsets[1:])]
 
-        filtered_tokens = [token.replace('#', '') for token in item.tokens]
-        character_sequence = [self._vocabulary_service.string_to_ids(
-            token) for token in filtered_tokens]
-        token_characters = [len(x) for x in character_sequence]
+        features = self._features[self._features_offsets[idx]:self._features_offsets[idx + 1]].tolist()
 
-        features = [
-            [x + 1 for x in list(feature_set.values())]
-            for feature_set in item.tokens_features
-        ]
+        pretrained_features = None
+        if self._pretrained_features is not None:
+            pretrained_features = self._pretrained_features.get_line_features(idx)
 
         return (
-            item.token_ids,
+            token_ids,
             entity_labels,
-            filtered_tokens,
-            item.position_changes,
+            self._filtered_tokens[idx],
+            self._position_changes[idx],
             character_sequence,
             token_characters,
             features,
-            item.document_id)
+            self._document_ids[idx],
+            pretrained_features)
+
+    def _materialize_collection(self):
+        """
+        Convert the whole collection once into flat integer arrays with offsets per line,
+        so that accessing an item only needs to slice them
+        """
+        include_targets = self._include_targets
+        ignore_unknown = (self._run_type == RunType.Test)
+
+        token_ids = []
+        entity_labels = None
+        if include_targets:
+            entity_labels = {
+                entity_tag_type: [] for entity_tag_type in self._arguments_service.entity_tag_types
+            }
+
+        character_sequences = []
+        features = []
+
+        self._filtered_tokens = []
+        self._position_changes = []
+        self._document_ids = []
+
+        for item in self.ne_collection:
+            token_ids.append(item.token_ids)
+
+            if include_targets:
+                current_entity_labels = self._process_service.get_entity_labels(item, ignore_unknown=ignore_unknown)
+                for entity_tag_type, labels in current_entity_labels.items():
+                    entity_labels[entity_tag_type].append(labels)
+
+            filtered_tokens = [token.replace('#', '') for token in item.tokens]
+            character_sequences.append([
+                self._vocabulary_service.string_to_ids(token) for token in filtered_tokens])
+
+            features.append([
+                [x + 1 for x in list(feature_set.values())]
+                for feature_set in item.tokens_features
+            ])
+
+            self._filtered_tokens.append(filtered_tokens)
+            self._position_changes.append(item.position_changes)
+            self._document_ids.append(item.document_id)
+
+        self._token_ids, self._token_ids_offsets = self._flatten(token_ids)
+
+        self._entity_labels = None
+        self._entity_labels_offsets = None
+        if include_targets:
+            self._entity_labels = {}
+            self._entity_labels_offsets = {}
+            for entity_tag_type, labels in entity_labels.items():
+                self._entity_labels[entity_tag_type], self._entity_labels_offsets[entity_tag_type] = self._flatten(labels)
+
+        # characters are kept per token, and the tokens per line
+        self._characters, self._token_character_offsets = self._flatten([
+            token_characters
+            for line_characters in character_sequences
+            for token_characters in line_characters])
+        self._characters_offsets = self._create_offsets([len(x) for x in character_sequences])
+
+        self._features_offsets = self._create_offsets([len(x) for x in features])
+        features_size = max([len(y) for x in features for y in x], default=0)
+        self._features = np.array(
+            [y for x in features for y in x], dtype=np.int64).reshape(self._features_offsets[-1], features_size)
+
+    def _flatten(self, list_of_lists: List[list]) -> Tuple[np.ndarray, np.ndarray]:
+        values = np.fromiter(
+            (y for x in list_of_lists for y in x), dtype=np.int64)
+        offsets = self._create_offsets([len(x) for x in list_of_lists])
+        return values, offsets
+
+    def _create_offsets(self, lengths: List[int]) -> np.ndarray:
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return offsets
+
+    def _slice_array(self, values: np.ndarray, offsets: np.ndarray, idx: int) -> List[int]:
+        return values[offsets[idx]:offsets[idx + 1]].tolist()
+
 
     @overrides
     def use_collate_function(self) -> bool:
         return True
 
+    @overrides
+    def get_item_lengths(self) -> np.ndarray:
+        return np.diff(self._token_ids_offsets)
+
     @overrides
     def collate_function(self, sequences):
         return self._pad_and_sort_batch(sequences)
@@ -97,14 +213,19 @@ class NERDataset(DatasetBase):
          character_sequences,
          token_characters_count,
          feature_set,
-         document_ids) = batch_split
+         document_ids,
+         pretrained_features) = batch_split
+
+        if self._pretrained_features is None:
+            pretrained_features = None
 
-        if not self._arguments_service.evaluate and self._run_type == RunType.Test:
+        if not self._include_targets:
             targets = None
 
-        pad_idx = self._process_service.pad_idx
+        # the batch is created on the CPU, the data loader moves it to the device
+        pad_idx = self._pad_idx
         batch_representation = BatchRepresentation(
-            device=self._device,
+            device='cpu',
             batch_size=batch_size,
             subword_sequences=sequences,
             character_sequences=character_sequences,
@@ -114,6 +235,7 @@ class NERDataset(DatasetBase):
             position_changes=position_changes,
             manual_features=feature_set,
             additional_information=document_ids,
+            pretrained_representations=pretrained_features,
             pad_idx=pad_idx)
 
         batch_representation.sort_batch()
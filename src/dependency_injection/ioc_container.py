@@ -32,6 +32,7 @@ from services.process.process_service_base import ProcessServiceBase
 from services.data_service import DataService
 from services.dataloader_service import DataLoaderService
 from services.dataset_service import DatasetService
+from services.export_service import ExportService
 from services.file_service import FileService
 from services.log_service import LogService
 from services.mask_service import MaskService
@@ -45,6 +46,7 @@ from services.train_service import TrainService
 from services.vocabulary_service import VocabularyService
 from services.plot_service import PlotService
 from services.cache_service import CacheService
+from services.pretrained_features_service import PretrainedFeaturesService
 from services.string_process_service import StringProcessService
 
 import logging
@@ -146,12 +148,21 @@ class IocContainer(containers.DeclarativeContainer):
             cache_service=cache_service,
             string_process_service=string_process_service))
 
+    pretrained_features_service = providers.Singleton(
+        PretrainedFeaturesService,
+        arguments_service=arguments_service,
+        cache_service=cache_service,
+        data_service=data_service,
+        file_service=file_service,
+        log_service=log_service)
+
     dataset_service = providers.Factory(
         DatasetService,
         arguments_service=arguments_service,
         mask_service=mask_service,
         process_service=process_service,
         vocabulary_service=vocabulary_service,
+        pretrained_features_service=pretrained_features_service,
         log_service=log_service)
 
     dataloader_service = providers.Factory(
@@ -240,6 +251,17 @@ class IocContainer(containers.DeclarativeContainer):
         dataloader_service=dataloader_service,
         evaluation_service=evaluation_service,
         file_service=file_service,
+        log_service=log_service,
+        model=model
+    )
+
+    export_service = providers.Factory(
+        ExportService,
+        arguments_service=arguments_service,
+        dataloader_service=dataloader_service,
+        file_service=file_service,
+        log_service=log_service,
+        process_service=process_service,
         model=model
     )
 
@@ -267,4 +289,5 @@ class IocContainer(containers.DeclarativeContainer):
         arguments_service=arguments_service,
         train_service=train_service,
         test_service=test_service,
+        export_service=export_service,
         log_service=log_service)
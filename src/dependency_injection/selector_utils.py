@@ -95,7 +95,7 @@ def get_experiment_service(arguments_service: ArgumentsServiceBase):
     return 'named_entity_recognition'
 
 def include_train_service(arguments_service: ArgumentsServiceBase):
-    if arguments_service.run_experiments or arguments_service.evaluate:
+    if arguments_service.run_experiments or arguments_service.evaluate or arguments_service.export_model:
         return 'exclude'
 
     return 'include'
@@ -1,6 +1,7 @@
 import numpy as np
 import torch
 
+from itertools import chain
 from typing import Tuple, List, Dict
 
 class BatchRepresentation:
@@ -19,7 +20,8 @@ class BatchRepresentation:
             offset_lists: List[Tuple] = None,
             pad_idx: int = 0,
             additional_information: object = None,
-            manual_features: list = []):
+            manual_features: list = [],
+            pretrained_representations: List[np.ndarray] = None):
 
         self._batch_size = batch_size
         self._device = device
@@ -48,13 +50,41 @@ class BatchRepresentation:
         self._word_characters_count = word_characters_count
 
         self._manual_features, _ = self._pad_and_convert_to_tensor(manual_features, pad_idx)
+        self._pretrained_representations = self._pad_representations(pretrained_representations)
 
         self._tokens = tokens
         self._offset_lists = offset_lists
         self._position_changes = position_changes
+        self._position_change_indices, self._merged_lengths = self._create_position_change_indices(
+            position_changes,
+            self._subword_sequences.shape[1] if self._subword_sequences is not None else 0)
         self._additional_information = additional_information
         self._pad_idx = pad_idx
 
+    @classmethod
+    def from_tensors(
+            cls,
+            device: str,
+            subword_sequences: torch.Tensor,
+            subword_lengths: torch.Tensor,
+            character_sequences: torch.Tensor = None,
+            subword_characters_count: torch.Tensor = None,
+            manual_features: torch.Tensor = None):
+        """
+        Create a batch from sequences which are already padded, used by exported models
+        which do not go through the data loaders
+        """
+        batch_representation = cls(
+            device=device,
+            batch_size=subword_sequences.shape[0],
+            character_sequences=character_sequences,
+            subword_sequences=subword_sequences,
+            subword_characters_count=subword_characters_count,
+            manual_features=manual_features)
+
+        batch_representation._subword_lengths = subword_lengths
+        return batch_representation
+
     def sort_batch(
         self,
         sort_tensor: torch.Tensor = None):
@@ -88,15 +118,53 @@ class BatchRepresentation:
         self._tokens = self._sort_list(self._tokens, perm_idx)
         self._offset_lists = self._sort_list(self._offset_lists, perm_idx)
         self._position_changes = self._sort_list(self._position_changes, perm_idx)
+        self._position_change_indices = self._sort_tensor(self._position_change_indices, perm_idx)
+        self._merged_lengths = self._sort_tensor(self._merged_lengths, perm_idx)
 
         self._word_characters_count = self._sort_list(self._word_characters_count, perm_idx)
 
         self._manual_features = self._sort_tensor(self._manual_features, perm_idx)
+        self._pretrained_representations = self._sort_tensor(self._pretrained_representations, perm_idx)
 
         self._additional_information = self._sort_list(self._additional_information, perm_idx)
 
         return perm_idx
 
+    def to(self, device: str, non_blocking: bool = False):
+        """
+        Move all tensors of the batch to the device.
+        Batches are created on the CPU, so that they can be padded in data loader workers,
+        and are moved to the device in the main process
+        """
+        for key, value in list(self.__dict__.items()):
+            self.__dict__[key] = self._apply_to_tensors(
+                value, lambda tensor: tensor.to(device, non_blocking=non_blocking))
+
+        self._device = device
+        return self
+
+    def pin_memory(self):
+        """
+        Pin the memory of all tensors of the batch, used by the data loader when pinning memory is enabled
+        """
+        for key, value in list(self.__dict__.items()):
+            self.__dict__[key] = self._apply_to_tensors(
+                value, lambda tensor: tensor.pin_memory())
+
+        return self
+
+    def _apply_to_tensors(self, value, function):
+        if isinstance(value, torch.Tensor):
+            return function(value)
+
+        if isinstance(value, dict) and any(isinstance(x, torch.Tensor) for x in value.values()):
+            return {
+                key: function(x) if isinstance(x, torch.Tensor) else x
+                for key, x in value.items()
+            }
+
+        return value
+
     def generate_mask(self, tensor: torch.Tensor) -> torch.Tensor:
         mask = (tensor != self._pad_idx).unsqueeze(-2)
         return mask
@@ -113,6 +181,40 @@ class BatchRepresentation:
 
         return [list_to_sort[i] for i in perm_idx]
 
+    def _create_position_change_indices(
+        self,
+        position_changes: List[Dict[int, List[int]]],
+        padded_subword_length: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Flatten the position changes of every sequence into the index of the merged position
+        of every subword, so that the subwords can be merged back with one scatter call.
+        Padding subwords are marked with -1 and the indices are padded to the length of the subword sequences
+        """
+        if position_changes is None or len(position_changes) == 0:
+            return (None, None)
+
+        merged_lengths = np.array([len(x) for x in position_changes], dtype=np.int64)
+        subword_length = max([padded_subword_length] + [
+            max([max(subword_positions) for subword_positions in x.values()]) + 1 if len(x) > 0 else 0
+            for x in position_changes])
+
+        indices = np.full((len(position_changes), subword_length), -1, dtype=np.int64)
+        for i, current_position_changes in enumerate(position_changes):
+            subword_positions = [
+                subword_position
+                for subword_positions in current_position_changes.values()
+                for subword_position in subword_positions]
+            merged_positions = [
+                merged_position
+                for merged_position, subword_positions in current_position_changes.items()
+                for _ in subword_positions]
+
+            indices[i, subword_positions] = merged_positions
+
+        return (
+            torch.from_numpy(indices).to(self._device),
+            torch.from_numpy(merged_lengths).to(self._device))
+
     def _pad_and_convert_to_tensor(
         self,
         list_to_modify: list,
@@ -136,25 +238,29 @@ class BatchRepresentation:
                 return (list_to_modify, np.ones((batch_size), dtype=np.long))
 
         use_3d_padding = isinstance(list_to_modify[0][0], list)
-        lengths = np.array([len(x) for x in list_to_modify])
-        max_length = max(lengths)
+        lengths = self._get_lengths(list_to_modify)
+        max_length = lengths.max()
+
+        # the values of all lists are concatenated and scattered into the padded array at once,
+        # using the index of the list and the position inside it of every value
+        sequence_indices = np.repeat(np.arange(batch_size), lengths)
+        positions = self._get_positions(lengths)
 
         if use_3d_padding:
-            sub_max_length = max([max([len(y) for y in x]) for x in list_to_modify])
-            padded_list = np.zeros((batch_size, max_length, sub_max_length), dtype=np.int64)
+            sublists = list(chain.from_iterable(list_to_modify))
+            sublengths = self._get_lengths(sublists)
+            sub_max_length = sublengths.max() if len(sublengths) > 0 else 0
+
+            padded_list = np.full((batch_size, max_length, sub_max_length), pad_idx, dtype=np.int64)
+            values = np.fromiter(chain.from_iterable(sublists), dtype=np.int64, count=sublengths.sum())
+            padded_list[
+                np.repeat(sequence_indices, sublengths),
+                np.repeat(positions, sublengths),
+                self._get_positions(sublengths)] = values
         else:
-            padded_list = np.zeros((batch_size, max_length), dtype=np.int64)
-
-        if pad_idx != 0:
-            padded_list.fill(pad_idx)
-
-        for i, length in enumerate(lengths):
-            if use_3d_padding:
-                padded_sublist, _ = self._pad_and_convert_to_tensor(list_to_modify[i], pad_idx, return_tensor=False)
-                max_sublength = padded_sublist.shape[-1]
-                padded_list[i, :length, :max_sublength] = padded_sublist
-            else:
-                padded_list[i, :length] = list_to_modify[i]
+            padded_list = np.full((batch_size, max_length), pad_idx, dtype=np.int64)
+            values = np.fromiter(chain.from_iterable(list_to_modify), dtype=np.int64, count=len(positions))
+            padded_list[sequence_indices, positions] = values
 
         if return_tensor:
             return (
@@ -163,6 +269,29 @@ class BatchRepresentation:
         else:
             return (padded_list, lengths)
 
+    def _pad_representations(self, representations: List[np.ndarray]) -> torch.Tensor:
+        if representations is None or len(representations) == 0:
+            return None
+
+        max_length = max([len(x) for x in representations])
+        padded_representations = np.zeros(
+            (len(representations), max_length, representations[0].shape[-1]), dtype=np.float32)
+
+        for i, sequence_representations in enumerate(representations):
+            padded_representations[i, :len(sequence_representations)] = sequence_representations
+
+        return torch.from_numpy(padded_representations).to(self._device)
+
+    def _get_lengths(self, lists: list) -> np.ndarray:
+        return np.fromiter((len(x) for x in lists), dtype=np.int64, count=len(lists))
+
+    def _get_positions(self, lengths: np.ndarray) -> np.ndarray:
+        """
+        Get the position of every value inside its list, for lists with the given lengths that are concatenated
+        """
+        offsets = np.cumsum(lengths) - lengths
+        return np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+
     def __str__(self):
         return f'batch-representation (size: {self._batch_size}, device: {self._device})'
 
@@ -212,6 +341,10 @@ class BatchRepresentation:
     def manual_features(self) -> torch.Tensor:
         return self._manual_features
 
+    @property
+    def pretrained_representations(self) -> torch.Tensor:
+        return self._pretrained_representations
+
     @property
     def tokens(self) -> list:
         return self._tokens
@@ -224,6 +357,14 @@ class BatchRepresentation:
     def position_changes(self) -> list:
         return self._position_changes
 
+    @property
+    def position_change_indices(self) -> torch.Tensor:
+        return self._position_change_indices
+
+    @property
+    def merged_lengths(self) -> torch.Tensor:
+        return self._merged_lengths
+
     @property
     def subword_characters_count(self) -> List[List[int]]:
         return self._subword_characters_count
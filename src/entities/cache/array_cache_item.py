@@ -0,0 +1,21 @@
+from typing import Dict
+
+import numpy as np
+
+
+class ArrayCacheItem:
+    """
+    Base for items that can be cached as a set of NumPy arrays and JSON serializable metadata
+    instead of as a pickle. The arrays are stored as `.npy` files and loaded memory-mapped,
+    so loading such an item does not depend on the size of its arrays.
+    """
+
+    def get_cache_arrays(self) -> Dict[str, np.ndarray]:
+        raise NotImplementedError()
+
+    def get_cache_metadata(self) -> dict:
+        raise NotImplementedError()
+
+    @classmethod
+    def from_cache(cls, arrays: Dict[str, np.ndarray], metadata: dict):
+        raise NotImplementedError()
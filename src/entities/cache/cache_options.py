@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List
 from enums.configuration import Configuration
 
 
@@ -12,7 +12,8 @@ class CacheOptions:
             seed_specific: bool = False,
             configuration: Configuration = None,
             seed: int = None,
-            key_suffixes: List[str] = None):
+            key_suffixes: List[str] = None,
+            input_fingerprints: Dict[str, str] = None):
 
         self._item_key = item_key
         self._configuration_specific = configuration_specific
@@ -22,6 +23,7 @@ class CacheOptions:
         self._configuration = configuration
         self._seed = seed
         self._key_suffixes = key_suffixes
+        self._input_fingerprints = input_fingerprints
 
     def get_item_key(self) -> str:
         result = self._item_key
@@ -54,3 +56,7 @@ class CacheOptions:
     @property
     def seed(self) -> int:
         return self._seed
+
+    @property
+    def input_fingerprints(self) -> Dict[str, str]:
+        return self._input_fingerprints
@@ -0,0 +1,245 @@
+from typing import Dict, List, Tuple
+from overrides import overrides
+
+import numpy as np
+
+from enums.entity_tag_type import EntityTagType
+from enums.word_feature import WordFeature
+
+from entities.cache.array_cache_item import ArrayCacheItem
+from entities.ner.ne_line import NELine
+from entities.ner.ne_collection import NECollection
+
+
+class ColumnarNECollection(ArrayCacheItem):
+    """
+    Array-backed alternative to `NECollection`.
+    The tokens, token ids, features and tags of all lines are kept in concatenated NumPy arrays
+    with offsets per line, while tokens and tags are interned to small integers.
+    Accessing a line creates an `NELine` view with the same data as the original line.
+    When cached, the arrays are stored as they are and loaded memory-mapped.
+    """
+
+    _array_attributes = [
+        '_tokens',
+        '_tokens_offsets',
+        '_token_ids',
+        '_token_ids_offsets',
+        '_features_offsets',
+        '_tokens_features',
+        '_has_position_changes',
+        '_position_changes_line_offsets',
+        '_subword_positions',
+        '_position_changes_offsets',
+        '_original_lengths'
+    ]
+
+    _tag_columns = [
+        'misc',
+        'ne_main',
+        'ne_person_name',
+        'ne_person_gender',
+        'ne_person_legal_status',
+        'ne_person_role',
+        'ne_organization_beneficiary'
+    ]
+
+    _entity_tag_columns = {
+        EntityTagType.Main: 'ne_main',
+        EntityTagType.Name: 'ne_person_name',
+        EntityTagType.Gender: 'ne_person_gender',
+        EntityTagType.LegalStatus: 'ne_person_legal_status',
+        EntityTagType.Role: 'ne_person_role',
+        EntityTagType.OrganizationBeneficiary: 'ne_organization_beneficiary',
+    }
+
+    def __init__(self, ne_collection: NECollection):
+        lines = ne_collection.lines
+
+        self._token_vocabulary: List[str] = []
+        token_vocabulary_ids: Dict[str, int] = {}
+        self._tokens, self._tokens_offsets = self._intern_column(
+            [line.tokens for line in lines], self._token_vocabulary, token_vocabulary_ids, np.int32)
+
+        self._token_ids, self._token_ids_offsets = self._flatten_column(
+            [line.token_ids for line in lines], np.int32)
+
+        # the tag vocabulary is shared by all tag columns, index 0 is kept for missing tags
+        self._tag_vocabulary: List[str] = [None]
+        tag_vocabulary_ids: Dict[str, int] = {None: 0}
+        self._tag_columns_data: Dict[str, Tuple[np.ndarray, np.ndarray]] = {
+            column: self._intern_column(
+                [getattr(line, column) for line in lines], self._tag_vocabulary, tag_vocabulary_ids, np.int16)
+            for column in self._tag_columns
+        }
+
+        self._feature_keys = []
+        for line in lines:
+            if len(line.tokens_features) > 0:
+                self._feature_keys = list(line.tokens_features[0].keys())
+                break
+
+        self._features_offsets = self._create_offsets(
+            [len(line.tokens_features) for line in lines])
+        self._tokens_features = np.array([
+            [feature_set[feature_key] for feature_key in self._feature_keys]
+            for line in lines
+            for feature_set in line.tokens_features
+        ], dtype=np.int8).reshape(self._features_offsets[-1], len(self._feature_keys))
+
+        # position changes are stored as the positions of all subwords, with offsets per word and per line
+        self._has_position_changes = np.array(
+            [line.position_changes is not None for line in lines], dtype=np.bool_)
+        position_changes = [
+            line.position_changes if line.position_changes is not None else {}
+            for line in lines
+        ]
+
+        self._position_changes_line_offsets = self._create_offsets(
+            [len(x) for x in position_changes])
+        self._subword_positions, self._position_changes_offsets = self._flatten_column([
+            subword_positions
+            for line_position_changes in position_changes
+            for subword_positions in line_position_changes.values()], np.int32)
+
+        self._original_lengths = np.array(
+            [line.original_length for line in lines], dtype=np.int32)
+        self._document_ids = [line.document_id for line in lines]
+
+    @overrides
+    def get_cache_arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {
+            attribute.lstrip('_'): getattr(self, attribute)
+            for attribute in self._array_attributes
+        }
+
+        for column, (values, offsets) in self._tag_columns_data.items():
+            arrays[f'{column}_values'] = values
+            arrays[f'{column}_offsets'] = offsets
+
+        return arrays
+
+    @overrides
+    def get_cache_metadata(self) -> dict:
+        return {
+            'token_vocabulary': self._token_vocabulary,
+            'tag_vocabulary': self._tag_vocabulary,
+            'feature_keys': [feature_key.value for feature_key in self._feature_keys],
+            'document_ids': self._document_ids
+        }
+
+    @classmethod
+    @overrides
+    def from_cache(cls, arrays: Dict[str, np.ndarray], metadata: dict):
+        collection = cls.__new__(cls)
+        for attribute in cls._array_attributes:
+            setattr(collection, attribute, arrays[attribute.lstrip('_')])
+
+        collection._tag_columns_data = {
+            column: (arrays[f'{column}_values'], arrays[f'{column}_offsets'])
+            for column in cls._tag_columns
+        }
+
+        collection._token_vocabulary = metadata['token_vocabulary']
+        collection._tag_vocabulary = metadata['tag_vocabulary']
+        collection._feature_keys = [WordFeature(feature_key) for feature_key in metadata['feature_keys']]
+        collection._document_ids = metadata['document_ids']
+
+        return collection
+
+    def get_unique_entity_tags(self, entity_tag_type: EntityTagType):
+        if entity_tag_type not in self._entity_tag_columns.keys():
+            raise Exception(f'Unsupported entity tag type {entity_tag_type}')
+
+        values, _ = self._tag_columns_data[self._entity_tag_columns[entity_tag_type]]
+
+        # keep the order of first appearance, same as the list-based collection
+        unique_values, first_indices = np.unique(values, return_index=True)
+        entities = [
+            self._tag_vocabulary[value]
+            for value in unique_values[np.argsort(first_indices)]
+        ]
+
+        return entities
+
+    @property
+    def lines(self) -> List[NELine]:
+        return [self[i] for i in range(len(self))]
+
+    def __getitem__(self, idx) -> NELine:
+        if idx < 0:
+            idx += len(self)
+
+        if idx < 0 or idx >= len(self):
+            raise IndexError('Collection index out of range')
+
+        line = NELine()
+        line.tokens = [
+            self._token_vocabulary[x]
+            for x in self._slice(self._tokens, self._tokens_offsets, idx)
+        ]
+
+        line.token_ids = self._slice(self._token_ids, self._token_ids_offsets, idx)
+
+        line.tokens_features = [
+            dict(zip(self._feature_keys, feature_values))
+            for feature_values in self._slice(self._tokens_features, self._features_offsets, idx)
+        ]
+
+        for column, (values, offsets) in self._tag_columns_data.items():
+            setattr(line, column, [
+                self._tag_vocabulary[x]
+                for x in self._slice(values, offsets, idx)
+            ])
+
+        if self._has_position_changes[idx]:
+            words_start = self._position_changes_line_offsets[idx]
+            words_end = self._position_changes_line_offsets[idx + 1]
+            line.position_changes = {
+                i: self._slice(self._subword_positions, self._position_changes_offsets, word_idx)
+                for i, word_idx in enumerate(range(words_start, words_end))
+            }
+
+        line.original_length = int(self._original_lengths[idx])
+        line.document_id = self._document_ids[idx]
+
+        return line
+
+    def __len__(self):
+        return len(self._document_ids)
+
+    def _intern_column(
+            self,
+            column_values: List[list],
+            vocabulary: List[str],
+            vocabulary_ids: Dict[str, int],
+            dtype) -> Tuple[np.ndarray, np.ndarray]:
+        interned_values = []
+        for values in column_values:
+            for value in values:
+                if value not in vocabulary_ids.keys():
+                    vocabulary_ids[value] = len(vocabulary)
+                    vocabulary.append(value)
+
+                interned_values.append(vocabulary_ids[value])
+
+        result = np.array(interned_values, dtype=dtype)
+        offsets = self._create_offsets([len(x) for x in column_values])
+        return result, offsets
+
+    def _flatten_column(
+            self,
+            column_values: List[list],
+            dtype) -> Tuple[np.ndarray, np.ndarray]:
+        result = np.fromiter(
+            (value for values in column_values for value in values), dtype=dtype)
+        offsets = self._create_offsets([len(x) for x in column_values])
+        return result, offsets
+
+    def _create_offsets(self, lengths: List[int]) -> np.ndarray:
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return offsets
+
+    def _slice(self, values: np.ndarray, offsets: np.ndarray, idx: int) -> list:
+        return values[offsets[idx]:offsets[idx + 1]].tolist()
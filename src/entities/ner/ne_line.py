@@ -1,5 +1,4 @@
-from typing import Dict, List
-from copy import deepcopy
+from typing import Dict, List, Tuple
 import re
 
 from enums.entity_tag_type import EntityTagType
@@ -87,12 +86,37 @@ class NELine:
         else:
             return feature_type.value + len(WordFeature)
 
-    def _insert_entity_tag(self, list_to_modify: list, position: int, tag: str):
-        tag_to_insert = tag
+    def _get_expanded_entity_tag(self, tag: str) -> str:
+        # we always use inside tags for the new sub-tokens, since even if the current token is the beginning of an entity,
+        # expanding it should not make the entity start appear twice
         if tag.startswith('B-'):
-            tag_to_insert = f'I-{tag[2:]}'
+            return f'I-{tag[2:]}'
 
-        list_to_modify.insert(position, tag_to_insert)
+        return tag
+
+    def _expand_list(
+            self,
+            list_to_expand: list,
+            position_changes: Dict[int, List[int]],
+            is_entity_tag: bool = False) -> list:
+        # lists which are not filled for this line (e.g. unused entity tag types) are left empty
+        if len(list_to_expand) == 0:
+            return list_to_expand
+
+        result = []
+        for i, new_positions in position_changes.items():
+            result.append(list_to_expand[i])
+
+            if len(new_positions) > 1:
+                # we copy the value of the original token
+                new_value = list_to_expand[i]
+                if is_entity_tag:
+                    new_value = self._get_expanded_entity_tag(new_value)
+
+                result.extend([new_value] * (len(new_positions) - 1))
+
+        result.extend(list_to_expand[len(position_changes):])
+        return result
 
     def get_entity_tags(self, entity_tag_type: EntityTagType):
         if entity_tag_type == EntityTagType.Main:
@@ -116,30 +140,39 @@ class NELine:
             string_process_service: StringProcessService,
             replace_all_numbers: bool = False,
             expand_targets: bool = True):
+        text = self.prepare_for_tokenization(
+            string_process_service,
+            replace_all_numbers=replace_all_numbers)
+
+        encoded_sequence = tokenize_service.encode_sequence(text)
+
+        self.update_tokens(
+            encoded_sequence,
+            expand_targets=expand_targets)
+
+    def prepare_for_tokenization(
+            self,
+            string_process_service: StringProcessService,
+            replace_all_numbers: bool = False) -> str:
         if replace_all_numbers:
             self.tokens = string_process_service.replace_strings_numbers(
                 self.tokens)
 
         self.original_length = len(self.tokens)
         text = self.get_text()
-        offsets = self.get_token_offsets()
+        return text
 
-        token_ids, encoded_tokens, encoded_offsets, _ = tokenize_service.encode_sequence(
-            text)
+    def update_tokens(
+            self,
+            encoded_sequence: Tuple[List[int], List[str], List[Tuple[int, int]], List[int]],
+            expand_targets: bool = True):
+        offsets = self.get_token_offsets()
+        token_ids, encoded_tokens, encoded_offsets, _ = encoded_sequence
 
         # it means that the tokenizer has split some of the words, therefore we need to add
         # those tokens to our collection and repeat the entity labels for the new sub-tokens
         position_changes = {i: [i] for i in range(len(self.tokens))}
         if len(encoded_tokens) > len(self.tokens):
-            new_misc = deepcopy(self.misc)
-            new_tokens_features = deepcopy(self.tokens_features)
-            new_ne_main = deepcopy(self.ne_main)
-            new_ne_person_name = deepcopy(self.ne_person_name)
-            new_ne_person_gender = deepcopy(self.ne_person_gender)
-            new_ne_person_legal_status = deepcopy(self.ne_person_legal_status)
-            new_ne_person_role = deepcopy(self.ne_person_role)
-            new_ne_organization_beneficiary = deepcopy(self.ne_organization_beneficiary)
-
             position_changes = {}
             corresponding_counter = 0
 
@@ -147,42 +180,30 @@ class NELine:
                 position_changes[i] = [corresponding_counter]
 
                 while corresponding_counter < len(encoded_tokens) and encoded_offsets[corresponding_counter][1] < offsets[i][1]:
-
-                    new_tokens_features.insert(
-                        corresponding_counter+1, self.tokens_features[i])
-
-                    # we always insert false for new segment start, since even if the current object is start of segment,
-                    # expanding it should not make the segment start appear twice
-                    if expand_targets:
-                        # we copy the value of the original token
-                        self._insert_entity_tag(
-                            new_misc, corresponding_counter+1, self.misc[i])
-                        self._insert_entity_tag(
-                            new_ne_main, corresponding_counter+1, self.ne_main[i])
-                        self._insert_entity_tag(
-                            new_ne_person_name, corresponding_counter+1, self.ne_person_name[i])
-                        self._insert_entity_tag(
-                            new_ne_person_gender, corresponding_counter+1, self.ne_person_gender[i])
-                        self._insert_entity_tag(
-                            new_ne_person_legal_status, corresponding_counter+1, self.ne_person_legal_status[i])
-                        self._insert_entity_tag(
-                            new_ne_person_role, corresponding_counter+1, self.ne_person_role[i])
-                        self._insert_entity_tag(
-                            new_ne_organization_beneficiary, corresponding_counter+1, self.ne_organization_beneficiary[i])
-
                     corresponding_counter += 1
                     position_changes[i].append(corresponding_counter)
 
                 corresponding_counter += 1
 
-            self.tokens_features = new_tokens_features
-            self.misc = new_misc
-            self.ne_main = new_ne_main
-            self.ne_person_name = new_ne_person_name
-            self.ne_person_gender = new_ne_person_gender
-            self.ne_person_legal_status = new_ne_person_legal_status
-            self.ne_person_role = new_ne_person_role
-            self.ne_organization_beneficiary = new_ne_organization_beneficiary
+            # the new lists are built in one pass, repeating the value of the original token for every new sub-token
+            self.tokens_features = self._expand_list(
+                self.tokens_features, position_changes)
+
+            if expand_targets:
+                self.misc = self._expand_list(
+                    self.misc, position_changes, is_entity_tag=True)
+                self.ne_main = self._expand_list(
+                    self.ne_main, position_changes, is_entity_tag=True)
+                self.ne_person_name = self._expand_list(
+                    self.ne_person_name, position_changes, is_entity_tag=True)
+                self.ne_person_gender = self._expand_list(
+                    self.ne_person_gender, position_changes, is_entity_tag=True)
+                self.ne_person_legal_status = self._expand_list(
+                    self.ne_person_legal_status, position_changes, is_entity_tag=True)
+                self.ne_person_role = self._expand_list(
+                    self.ne_person_role, position_changes, is_entity_tag=True)
+                self.ne_organization_beneficiary = self._expand_list(
+                    self.ne_organization_beneficiary, position_changes, is_entity_tag=True)
 
         self.position_changes = position_changes
 
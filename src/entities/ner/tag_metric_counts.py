@@ -0,0 +1,131 @@
+from typing import Dict, List
+
+import numpy as np
+
+from enums.tag_metric import TagMetric
+from enums.tag_measure_type import TagMeasureType
+
+
+class TagMetricCounts:
+    """
+    Accumulator of the tagging evaluation counts, overall and per entity type.
+    Counts are kept in (measure type x count metric) arrays, per entity type they are stacked
+    in the order in which the entity types were first seen. The scores of every document are
+    kept per measure type and macro doc metric so that they can be averaged afterwards.
+    """
+
+    measure_types = [
+        TagMeasureType.Strict,
+        TagMeasureType.Partial
+    ]
+
+    count_metrics = [
+        TagMetric.Correct,
+        TagMetric.Incorrect,
+        TagMetric.Partial,
+        TagMetric.Missed,
+        TagMetric.Spurious
+    ]
+
+    doc_metrics = [
+        TagMetric.PrecisionMacroDoc,
+        TagMetric.RecallMacroDoc,
+        TagMetric.F1ScoreMacroDoc
+    ]
+
+    def __init__(self):
+        self._counts = self.create_counts()
+        self._doc_scores = self._create_doc_scores()
+
+        self._entity_types: List[str] = []
+        self._entity_type_indices: Dict[str, int] = {}
+        self._counts_per_type = self.create_counts(number_of_entity_types=0)
+        self._doc_scores_per_type: List[List[List[List[float]]]] = []
+
+    @classmethod
+    def create_counts(cls, number_of_entity_types: int = None) -> np.ndarray:
+        shape = (len(cls.measure_types), len(cls.count_metrics))
+        if number_of_entity_types is not None:
+            shape = (number_of_entity_types,) + shape
+
+        return np.zeros(shape, dtype=np.int64)
+
+    def add_counts(
+            self,
+            counts: np.ndarray,
+            entity_types: List[str],
+            counts_per_type: np.ndarray) -> List[int]:
+        """
+        Add the counts of a segment to the accumulated counts
+        :param counts: overall counts of the segment (measure types x count metrics)
+        :param entity_types: entity types of the segment in the order they were seen
+        :param counts_per_type: counts of the segment for each of the entity types (entity types x measure types x count metrics)
+        :return: the indices of the entity types in the accumulator
+        """
+        self._counts += counts
+
+        entity_type_indices = [
+            self._get_entity_type_index(entity_type)
+            for entity_type in entity_types
+        ]
+
+        if len(entity_type_indices) > 0:
+            self._counts_per_type[entity_type_indices] += counts_per_type
+
+        return entity_type_indices
+
+    def add_doc_scores(
+            self,
+            measure_type_idx: int,
+            doc_scores: List[float],
+            entity_type_idx: int = None):
+        """
+        Add the scores of a document, `None` scores are dismissed
+        :param measure_type_idx: index of the measure type
+        :param doc_scores: a score for every macro doc metric
+        :param entity_type_idx: index of the entity type, the overall scores are updated if missing
+        """
+        if entity_type_idx is None:
+            measure_type_scores = self._doc_scores[measure_type_idx]
+        else:
+            measure_type_scores = self._doc_scores_per_type[entity_type_idx][measure_type_idx]
+
+        for metric_scores, doc_score in zip(measure_type_scores, doc_scores):
+            if doc_score is not None:
+                metric_scores.append(doc_score)
+
+    @property
+    def counts(self) -> np.ndarray:
+        return self._counts
+
+    @property
+    def doc_scores(self) -> List[List[List[float]]]:
+        return self._doc_scores
+
+    @property
+    def entity_types(self) -> List[str]:
+        return self._entity_types
+
+    @property
+    def counts_per_type(self) -> np.ndarray:
+        return self._counts_per_type
+
+    @property
+    def doc_scores_per_type(self) -> List[List[List[List[float]]]]:
+        return self._doc_scores_per_type
+
+    def _get_entity_type_index(self, entity_type: str) -> int:
+        if entity_type not in self._entity_type_indices.keys():
+            self._entity_type_indices[entity_type] = len(self._entity_types)
+            self._entity_types.append(entity_type)
+            self._counts_per_type = np.concatenate(
+                (self._counts_per_type, self.create_counts(number_of_entity_types=1)))
+            self._doc_scores_per_type.append(self._create_doc_scores())
+
+        return self._entity_type_indices[entity_type]
+
+    def _create_doc_scores(self) -> List[List[List[float]]]:
+        return [
+            [[] for _ in self.doc_metrics]
+            for _ in self.measure_types
+        ]
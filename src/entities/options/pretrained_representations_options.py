@@ -12,7 +12,8 @@ class PretrainedRepresentationsOptions:
             fine_tune_pretrained: bool = False,
             fine_tune_after_convergence: bool = False,
             fasttext_model: str = None,
-            fasttext_model_size: int = None):
+            fasttext_model_size: int = None,
+            unpad_pretrained_inputs: bool = False):
         self.include_pretrained_model = include_pretrained_model
         self.pretrained_model_size = pretrained_model_size
         self.pretrained_weights = pretrained_weights
@@ -23,6 +24,7 @@ class PretrainedRepresentationsOptions:
         self.include_fasttext_model = include_fasttext_model
         self.fasttext_model = fasttext_model
         self.fasttext_model_size = fasttext_model_size
+        self.unpad_pretrained_inputs = unpad_pretrained_inputs
 
         assert not include_pretrained_model or (
             include_pretrained_model and pretrained_model_size is not None and pretrained_weights is not None and pretrained_max_length is not None)
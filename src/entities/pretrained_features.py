@@ -0,0 +1,55 @@
+from typing import Dict
+from overrides import overrides
+
+import numpy as np
+
+from entities.cache.array_cache_item import ArrayCacheItem
+
+
+class PretrainedFeatures(ArrayCacheItem):
+    """
+    Representations of a frozen pre-trained model for every subword of a collection.
+    The representations of all lines are concatenated in one array with offsets per line,
+    so that once cached they are read from a memory-mapped file
+    """
+
+    def __init__(self, features: np.ndarray, offsets: np.ndarray):
+        self._features = features
+        self._offsets = offsets
+
+    def get_line_features(self, idx: int) -> np.ndarray:
+        return self._features[self._offsets[idx]:self._offsets[idx + 1]]
+
+    @overrides
+    def get_cache_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            'features': self._features,
+            'offsets': self._offsets
+        }
+
+    @overrides
+    def get_cache_metadata(self) -> dict:
+        return {}
+
+    @classmethod
+    @overrides
+    def from_cache(cls, arrays: Dict[str, np.ndarray], metadata: dict):
+        return cls(arrays['features'], arrays['offsets'])
+
+    def __getstate__(self):
+        # memory-mapped features are reopened instead of being copied to data loader workers
+        state = self.__dict__.copy()
+        if isinstance(self._features, np.memmap):
+            state['_features'] = (self._features.filename, self._features.dtype, self._features.offset, self._features.shape)
+
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state['_features'], tuple):
+            filename, dtype, offset, shape = state['_features']
+            state['_features'] = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+        self.__dict__.update(state)
+
+    def __len__(self):
+        return len(self._offsets) - 1
@@ -7,6 +7,7 @@ from services.arguments.arguments_service_base import ArgumentsServiceBase
 from services.data_service import DataService
 from services.train_service import TrainService
 from services.test_service import TestService
+from services.export_service import ExportService
 
 def initialize_seed(seed: int, device: str):
     torch.manual_seed(seed)
@@ -22,6 +23,7 @@ def main(
         arguments_service: ArgumentsServiceBase,
         train_service: TrainService,
         test_service: TestService,
+        export_service: ExportService,
         log_service: LogService):
 
     log_service.log_arguments()
@@ -31,6 +33,9 @@ def main(
         if arguments_service.evaluate:
             log_service.log_debug('Starting TEST run')
             test_service.test()
+        elif arguments_service.export_model:
+            log_service.log_debug('Starting EXPORT run')
+            export_service.export()
         elif not arguments_service.run_experiments:
             log_service.log_debug('Starting TRAIN run')
             train_service.train()
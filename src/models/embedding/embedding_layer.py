@@ -21,6 +21,8 @@ from services.arguments.pretrained_arguments_service import PretrainedArgumentsS
 from services.tokenize.base_tokenize_service import BaseTokenizeService
 from services.file_service import FileService
 
+from utils.tensor_utils import scatter_mean
+
 
 class EmbeddingLayer(ModelBase):
     def __init__(
@@ -151,8 +153,13 @@ class EmbeddingLayer(ModelBase):
                     batch_representation.subword_characters_count)
 
         if include_pretrained and not skip_pretrained_representation:
-            pretrained_embeddings = self._pretrained_layer.get_pretrained_representation(
-                batch_representation.subword_sequences)
+            # precomputed representations can only be used while the pre-trained model is frozen
+            if batch_representation.pretrained_representations is not None and self._pretrained_layer.keep_frozen:
+                pretrained_embeddings = batch_representation.pretrained_representations
+            else:
+                pretrained_embeddings = self._pretrained_layer.get_pretrained_representation(
+                    batch_representation.subword_sequences,
+                    batch_representation.subword_lengths)
 
         if self._include_fasttext_model and not skip_pretrained_representation:
             fasttext_embeddings = self._pretrained_layer.get_fasttext_representation(
@@ -225,15 +232,20 @@ class EmbeddingLayer(ModelBase):
 
             if self._merge_subword_embeddings and batch_representation.position_changes is not None:
                 result_embeddings, batch_representation._subword_lengths = self._restore_position_changes(
-                    position_changes=batch_representation.position_changes,
-                    embeddings=result_embeddings,
-                    lengths=batch_representation.subword_lengths)
+                    position_change_indices=batch_representation.position_change_indices,
+                    merged_lengths=batch_representation.merged_lengths,
+                    embeddings=result_embeddings)
 
         elif self._output_embedding_type == EmbeddingType.Word:
             result_embeddings = word_embeddings
 
         return result_embeddings
 
+    @overrides
+    def quantize(self, quantize_pretrained_model: bool, quantize_rnn_encoder: bool):
+        if quantize_pretrained_model and self._include_pretrained:
+            self._pretrained_layer.quantize(quantize_pretrained_model, quantize_rnn_encoder)
+
     def _add_subword_to_character_embeddings(
             self,
             character_embeddings,
@@ -272,31 +284,29 @@ class EmbeddingLayer(ModelBase):
 
     def _restore_position_changes(
             self,
-            position_changes,
-            embeddings,
-            lengths):
+            position_change_indices: torch.Tensor,
+            merged_lengths: torch.Tensor,
+            embeddings: torch.Tensor):
         batch_size, sequence_length, embeddings_size = embeddings.shape
 
-        new_max_sequence_length = max(
-            [len(x.keys()) for x in position_changes])
+        assert position_change_indices.shape[1] == sequence_length, f'position changes cover {position_change_indices.shape[1]} subwords but the sequences have {sequence_length}'
 
-        new_embeddings = torch.zeros(
-            (batch_size, new_max_sequence_length, embeddings_size), dtype=embeddings.dtype).to(self._device)
-        new_lengths = torch.zeros(
-            (batch_size), dtype=lengths.dtype).to(self._device)
+        new_max_sequence_length = int(merged_lengths.max())
 
-        for i, current_position_changes in enumerate(position_changes):
-            new_lengths[i] = len(current_position_changes.keys())
+        # offset the merged positions of every sequence so that all of them are merged at once
+        sequence_offsets = torch.arange(
+            batch_size, device=position_change_indices.device).unsqueeze(-1) * new_max_sequence_length
+        flat_indices = torch.where(
+            position_change_indices >= 0,
+            position_change_indices + sequence_offsets,
+            position_change_indices)
 
-            for old_position, new_positions in current_position_changes.items():
-                if len(new_positions) == 1:
-                    new_embeddings[i, old_position,
-                                   :] = embeddings[i, new_positions[0], :]
-                else:
-                    new_embeddings[i, old_position, :] = torch.mean(
-                        embeddings[i, new_positions], dim=0)
+        new_embeddings = scatter_mean(
+            embeddings.reshape(-1, embeddings_size),
+            flat_indices.view(-1),
+            batch_size * new_max_sequence_length).view(batch_size, new_max_sequence_length, embeddings_size)
 
-        return new_embeddings, new_lengths
+        return new_embeddings, merged_lengths
 
     def _add_character_to_subword_embeddings(
             self,
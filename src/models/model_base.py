@@ -194,6 +194,19 @@ class ModelBase(nn.Module):
     def keep_frozen(self) -> bool:
         return False
 
+    def quantize(self, quantize_pretrained_model: bool, quantize_rnn_encoder: bool):
+        """
+        Apply dynamic int8 quantization to the supported layers, used for inference on CPU
+        """
+        pass
+
+    def create_inference_module(self) -> nn.Module:
+        """
+        Create a module which runs inference using only tensors, so that it can be exported.
+        Models which do not support exporting return None
+        """
+        return None
+
     def optimizer_parameters(self):
         return self.parameters()
 
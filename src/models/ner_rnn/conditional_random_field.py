@@ -11,6 +11,155 @@ from overrides import overrides
 from models.model_base import ModelBase
 
 
+class LogSumExpStep(autograd.Function):
+    """
+    One step of the forward algorithm, computed directly from the emissions and the transition matrix:
+    log-sum-exp over the previous labels of `previous_alpha + (transitions + emissions) * weights`.
+    Only the (batch x number_of_tags) inputs are kept for the backward pass, the
+    (batch x number_of_tags x number_of_tags) scores are recomputed there instead of being stored for every position.
+    """
+
+    @staticmethod
+    def forward(ctx, previous_alpha, transition_matrix, emissions, weights):
+        scores = LogSumExpStep._calculate_scores(
+            previous_alpha, transition_matrix, emissions, weights)
+        result = torch.logsumexp(scores, dim=1)
+
+        ctx.save_for_backward(
+            previous_alpha, transition_matrix, emissions, weights, result)
+
+        return result
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        previous_alpha, transition_matrix, emissions, weights, result = ctx.saved_tensors
+        scores = LogSumExpStep._calculate_scores(
+            previous_alpha, transition_matrix, emissions, weights)
+
+        # gradient w.r.t. the scores is the softmax over the previous labels scaled by the incoming gradient
+        scores_gradient = (scores - result.unsqueeze(1)).exp() * grad_output.unsqueeze(1)
+        grad_previous_alpha = scores_gradient.sum(dim=2)
+
+        if weights is not None:
+            scores_gradient = scores_gradient * weights.unsqueeze(1)
+
+        grad_transition_matrix = None
+        if ctx.needs_input_grad[1]:
+            grad_transition_matrix = scores_gradient
+            if transition_matrix.dim() == 2:
+                grad_transition_matrix = scores_gradient.sum(dim=0)
+
+        grad_emissions = scores_gradient.sum(dim=1)
+
+        return grad_previous_alpha, grad_transition_matrix, grad_emissions, None
+
+    @staticmethod
+    def _calculate_scores(previous_alpha, transition_matrix, emissions, weights):
+        word_scores = transition_matrix + emissions.unsqueeze(1)
+        if weights is not None:
+            word_scores = word_scores * weights.unsqueeze(1)
+
+        scores = previous_alpha.unsqueeze(-1) + word_scores
+        return scores
+
+
+def viterbi_decode_from_emissions(
+        rnn_features: torch.Tensor,
+        transition_matrix: torch.Tensor,
+        word_seq_lens: torch.Tensor,
+        start_idx: int,
+        end_idx: int,
+        pad_idx: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Use Viterbi to decode the instances, directly from the emissions.
+    Kept free of module state so that it can be compiled with TorchScript when exporting a model
+    :param rnn_features: emission scores (batch_size x max_length x number_of_tags)
+    :param transition_matrix: (number_of_tags x number_of_tags) or one matrix per sequence (batch_size x number_of_tags x number_of_tags)
+    :param word_seq_lens: (batch_size)
+    :param start_idx: the label every sequence starts from
+    :param end_idx: the label every sequence ends with
+    :param pad_idx: the label of positions after the sequence lengths
+    :return: the best scores as well as the predicted label ids.
+           (batch_size x 1) and (batch_size x max_length)
+    """
+    batch_size, max_length, number_of_tags = rnn_features.shape
+    word_seq_lens = word_seq_lens.to(rnn_features.device)
+
+    indices_records = torch.zeros(
+        (batch_size, max_length, number_of_tags),
+        dtype=torch.int64,
+        device=rnn_features.device)
+
+    decoded_tags = torch.full(
+        (batch_size, max_length),
+        pad_idx,
+        dtype=torch.long,
+        device=rnn_features.device)
+
+    indices_records[:, 0, :] = start_idx
+    current_scores = transition_matrix[..., start_idx, :] + rnn_features[:, 0]
+    last_scores = current_scores
+    for word_idx in range(1, max_length):
+        # the edge scores are added first, in the same order as `calculate_all_scores` does
+        word_scores = current_scores.unsqueeze(-1) + \
+            (transition_matrix + rnn_features[:, word_idx].unsqueeze(1))
+
+        # the best previous label idx to current labels
+        current_scores, current_indices = torch.max(word_scores, dim=1)
+        indices_records[:, word_idx, :] = current_indices
+        last_scores = torch.where(
+            (word_seq_lens > word_idx).unsqueeze(-1),
+            current_scores,
+            last_scores)
+
+    last_scores = last_scores + transition_matrix[..., :, end_idx]
+    best_scores, last_indices = torch.max(last_scores, dim=1)
+
+    decoded_tags = backtrace(
+        indices_records,
+        last_indices,
+        word_seq_lens,
+        decoded_tags)
+
+    return best_scores.unsqueeze(-1), decoded_tags
+
+
+def backtrace(
+        indices_records: torch.Tensor,
+        last_indices: torch.Tensor,
+        word_seq_lens: torch.Tensor,
+        decoded_tags: torch.Tensor) -> torch.Tensor:
+    """
+    Follow the best previous label records backwards for all sequences of the batch at once
+    :param indices_records: (batch_size x max_length x number_of_tags)
+    :param last_indices: the best label at the last position of each sequence (batch_size)
+    :param word_seq_lens: (batch_size)
+    :param decoded_tags: (batch_size x max_length) filled with the padding label
+    :return: the decoded tags, positions after the sequence lengths keep the padding label
+    """
+    _, max_length, _ = indices_records.shape
+    word_seq_lens = word_seq_lens.to(indices_records.device)
+
+    current_tags = last_indices
+    for word_idx in range(max_length - 1, -1, -1):
+        # sequences which end at this position start their backtrace from the best last label
+        current_tags = torch.where(
+            word_seq_lens == (word_idx + 1),
+            last_indices,
+            current_tags)
+
+        decoded_tags[:, word_idx] = torch.where(
+            word_seq_lens > word_idx,
+            current_tags,
+            decoded_tags[:, word_idx])
+
+        if word_idx > 0:
+            current_tags = indices_records[:, word_idx].gather(
+                1, current_tags.unsqueeze(-1)).squeeze(-1)
+
+    return decoded_tags
+
+
 class ConditionalRandomField(ModelBase):
     def __init__(
             self,
@@ -24,7 +173,8 @@ class ConditionalRandomField(ModelBase):
             stop_token_id: int,
             pad_token_id: int,
             none_id: int,
-            use_weighted_loss: bool):
+            use_weighted_loss: bool,
+            memory_efficient: bool = False):
         super().__init__(data_service, arguments_service, log_service)
 
         self._number_of_tags = num_of_tags
@@ -39,6 +189,10 @@ class ConditionalRandomField(ModelBase):
 
         self.use_weighted_loss = use_weighted_loss
 
+        # if set, scores are computed per position from the emissions and the transition matrix
+        # instead of materializing the (batch x max_length x number_of_tags x number_of_tags) tensor
+        self._memory_efficient = memory_efficient
+
         # initialize the following transition (anything never -> start. end never -> anything. Same thing for the padding label)
         init_transition = torch.randn(
             self._number_of_tags, self._number_of_tags, device=self._device)
@@ -71,14 +225,12 @@ class ConditionalRandomField(ModelBase):
         :param mask:
         :return:
         """
+        if self._memory_efficient:
+            return self._forward_memory_efficient(rnn_features, lengths, targets, mask)
+
         all_scores = self.calculate_all_scores(rnn_features=rnn_features)
-        batch_size = rnn_features.shape[0]
         if self.training and self.use_weighted_loss:
-            weighted_scores = torch.ones(all_scores.shape, device=all_scores.device)
-            for b in range(batch_size):
-                for word_idx in range(lengths[b]):
-                    for tag in range(self._number_of_tags):
-                        weighted_scores[b, word_idx, :, tag] = all_scores[b, word_idx, :, tag] * self._weighted_loss_matrix[targets[b, word_idx], tag]
+            weighted_scores = self._calculate_weighted_scores(all_scores, targets, mask)
         else:
             weighted_scores = all_scores
 
@@ -209,6 +361,30 @@ class ConditionalRandomField(ModelBase):
         all_scores = (expanded_transition_matrix + expanded_rnn_features)
         return all_scores
 
+    def _calculate_weighted_scores(
+            self,
+            all_scores: torch.Tensor,
+            targets: torch.Tensor,
+            mask: torch.Tensor) -> torch.Tensor:
+        """
+        Scale the scores of every edge going into a tag using the weighted loss matrix row of the gold tag.
+        Positions outside of the sequence lengths are filled with ones.
+        :param all_scores: (batch_size x max_length x number_of_tags x number_of_tags)
+        :param targets: (batch_size x max_length)
+        :param mask: (batch_size x max_length)
+        :return: weighted scores with the same shape as `all_scores`
+        """
+        # batch_size x max_length x number_of_tags, the weight for every `to` tag given the gold tag
+        target_weights = self._weighted_loss_matrix[targets]
+
+        weighted_scores = all_scores * target_weights.unsqueeze(2)
+        weighted_scores = torch.where(
+            mask.bool().view(mask.shape[0], mask.shape[1], 1, 1),
+            weighted_scores,
+            torch.ones_like(weighted_scores))
+
+        return weighted_scores
+
     def decode(
             self,
             features,
@@ -218,6 +394,11 @@ class ConditionalRandomField(ModelBase):
         :param batchInput:
         :return:
         """
+        if self._memory_efficient:
+            _, decodeIdx = self._viterbi_decode_from_emissions(
+                features, self._transition_matrix, wordSeqLengths)
+            return decodeIdx
+
         all_scores = self.calculate_all_scores(features)
         _, decodeIdx = self._viterbi_decode(
             all_scores, wordSeqLengths)
@@ -284,17 +465,169 @@ class ConditionalRandomField(ModelBase):
         last_indices = torch.argmax(lastScores, 1)
         bestScores = lastScores.gather(1, last_indices.unsqueeze(-1))
 
-        for b, word_seq_len in enumerate(word_seq_lens):
-            decoded_tags[b, word_seq_len-1] = last_indices[b]
-
-            for distance2Last in range(1, word_seq_len):
-                lastNIdxRecord = indices_records[b,
-                                                 word_seq_len - distance2Last]
-                decoded_tags[b, word_seq_len - distance2Last -
-                             1] = lastNIdxRecord[decoded_tags[b, word_seq_len - distance2Last]]
+        decoded_tags = self._backtrace(
+            indices_records,
+            last_indices,
+            word_seq_lens,
+            decoded_tags)
 
         return bestScores, decoded_tags
 
+    def _backtrace(
+            self,
+            indices_records: torch.Tensor,
+            last_indices: torch.Tensor,
+            word_seq_lens: torch.Tensor,
+            decoded_tags: torch.Tensor) -> torch.Tensor:
+        return backtrace(indices_records, last_indices, word_seq_lens, decoded_tags)
+
+    def _forward_memory_efficient(
+            self,
+            rnn_features: torch.Tensor,
+            lengths: torch.Tensor,
+            targets: torch.Tensor,
+            mask: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Calculate the negative log-likelihood without materializing the scores for all edges.
+        Peak memory is O(batch_size * max_length * number_of_tags)
+        """
+        target_weights = None
+        if self.training and self.use_weighted_loss:
+            target_weights = self._weighted_loss_matrix[targets]
+
+        unlabeled_scores = self._forward_unlabeled_from_emissions(
+            rnn_features, self._transition_matrix, lengths, target_weights)
+        labeled_scores = self._forward_labeled_from_emissions(
+            rnn_features, self._transition_matrix, lengths, targets, mask, target_weights)
+        loss = torch.mean(unlabeled_scores) - torch.mean(labeled_scores)
+
+        _, decoded_tags = self._viterbi_decode_from_emissions(
+            rnn_features, self._transition_matrix, lengths)
+
+        return loss, decoded_tags
+
+    def _forward_unlabeled_from_emissions(
+            self,
+            rnn_features: torch.Tensor,
+            transition_matrix: torch.Tensor,
+            word_seq_lens: torch.Tensor,
+            target_weights: torch.Tensor = None) -> torch.Tensor:
+        """
+        Calculate the normalization term with the forward algorithm, directly from the emissions
+        :param rnn_features: emission scores (batch_size x max_length x number_of_tags)
+        :param transition_matrix: (number_of_tags x number_of_tags) or one matrix per sequence (batch_size x number_of_tags x number_of_tags)
+        :param word_seq_lens: (batch_size)
+        :param target_weights: optional weights of every `to` label per position (batch_size x max_length x number_of_tags)
+        :return: the score for all the possible structures per sequence (batch_size)
+        """
+        _, max_length, _ = rnn_features.shape
+        word_seq_lens = word_seq_lens.to(rnn_features.device)
+
+        # the first position of all labels = (the transition from start - > all labels) + current emission
+        alpha = transition_matrix[..., self.start_idx, :] + rnn_features[:, 0]
+        if target_weights is not None:
+            alpha = alpha * target_weights[:, 0]
+
+        last_alpha = alpha
+        for word_idx in range(1, max_length):
+            alpha = LogSumExpStep.apply(
+                alpha,
+                transition_matrix,
+                rnn_features[:, word_idx],
+                target_weights[:, word_idx] if target_weights is not None else None)
+
+            # keep the alpha of the last real position of every sequence
+            last_alpha = torch.where(
+                (word_seq_lens > word_idx).unsqueeze(-1),
+                alpha,
+                last_alpha)
+
+        last_alpha = last_alpha + transition_matrix[..., :, self.end_idx]
+        result = torch.logsumexp(last_alpha, dim=-1)
+        return result
+
+    def _forward_labeled_from_emissions(
+            self,
+            rnn_features: torch.Tensor,
+            transition_matrix: torch.Tensor,
+            word_seq_lens: torch.Tensor,
+            targets: torch.Tensor,
+            masks: torch.Tensor,
+            target_weights: torch.Tensor = None) -> torch.Tensor:
+        """
+        Calculate the scores for the gold instances, directly from the emissions
+        :param rnn_features: emission scores (batch_size x max_length x number_of_tags)
+        :param transition_matrix: (number_of_tags x number_of_tags) or one matrix per sequence (batch_size x number_of_tags x number_of_tags)
+        :param word_seq_lens: (batch_size)
+        :param targets: (batch_size x max_length)
+        :param masks: (batch_size x max_length)
+        :param target_weights: optional weights of every `to` label per position (batch_size x max_length x number_of_tags)
+        :return: the score of the gold sequences (batch_size)
+        """
+        batch_size, max_length, _ = rnn_features.shape
+        word_seq_lens = word_seq_lens.to(rnn_features.device)
+
+        previous_targets = torch.cat([
+            torch.full((batch_size, 1), self.start_idx, dtype=targets.dtype, device=targets.device),
+            targets[:, :-1]], dim=1)
+
+        # score of every gold edge, (batch_size x max_length)
+        transition_scores = self._get_transition_scores(
+            transition_matrix, previous_targets, targets)
+        emission_scores = rnn_features.gather(2, targets.unsqueeze(-1)).squeeze(-1)
+        gold_scores = transition_scores + emission_scores
+        if target_weights is not None:
+            gold_scores = gold_scores * target_weights.gather(2, targets.unsqueeze(-1)).squeeze(-1)
+
+        # the first position is always part of the sequence
+        masks = masks.clone().bool()
+        masks[:, 0] = True
+        gold_scores = torch.where(masks, gold_scores, torch.zeros_like(gold_scores))
+
+        end_tags = targets.gather(1, word_seq_lens.unsqueeze(-1) - 1)
+        end_transition_scores = self._get_transition_scores(
+            transition_matrix,
+            end_tags,
+            torch.full_like(end_tags, self.end_idx)).squeeze(-1)
+
+        score = torch.sum(gold_scores, dim=1) + end_transition_scores
+        return score
+
+    def _get_transition_scores(
+            self,
+            transition_matrix: torch.Tensor,
+            from_tags: torch.Tensor,
+            to_tags: torch.Tensor) -> torch.Tensor:
+        """
+        Look up the transition scores between the given labels
+        :param transition_matrix: (number_of_tags x number_of_tags) or (batch_size x number_of_tags x number_of_tags)
+        :param from_tags: (batch_size x length)
+        :param to_tags: (batch_size x length)
+        :return: (batch_size x length)
+        """
+        if transition_matrix.dim() == 2:
+            return transition_matrix[from_tags, to_tags]
+
+        batch_indices = torch.arange(
+            transition_matrix.shape[0], device=from_tags.device).unsqueeze(-1)
+        return transition_matrix[batch_indices, from_tags, to_tags]
+
+    def _viterbi_decode_from_emissions(
+            self,
+            rnn_features: torch.Tensor,
+            transition_matrix: torch.Tensor,
+            word_seq_lens: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        with torch.no_grad():
+            result = viterbi_decode_from_emissions(
+                rnn_features,
+                transition_matrix,
+                word_seq_lens,
+                self.start_idx,
+                self.end_idx,
+                self.pad_idx)
+
+        return result
+
     def _log_sum_exp(
             self,
             vec: torch.Tensor,
@@ -0,0 +1,177 @@
+from services.log_service import LogService
+from services.arguments.arguments_service_base import ArgumentsServiceBase
+from services.data_service import DataService
+import torch
+import torch.nn.functional as F
+
+from typing import Dict, List, Tuple
+from models.model_base import ModelBase
+from models.ner_rnn.conditional_random_field import ConditionalRandomField
+
+from enums.entity_tag_type import EntityTagType
+
+
+class FusedConditionalRandomField(ModelBase):
+    """
+    Runs the CRF layers of all entity tag types in one batched pass.
+    The transition matrices of all heads are padded to the biggest number of tags and stacked,
+    so that the forward algorithm and Viterbi loop over the sequence only once instead of once per head.
+    The parameters stay owned by the given CRF layers, this module does not register them again.
+    """
+
+    _padding_score = -10000.0
+
+    def __init__(
+            self,
+            data_service: DataService,
+            arguments_service: ArgumentsServiceBase,
+            log_service: LogService,
+            crf_layers: List[ConditionalRandomField],
+            entity_tag_types: List[EntityTagType]):
+        super().__init__(data_service, arguments_service, log_service)
+
+        # kept in a tuple so the layers are not registered as sub-modules twice
+        self._crf_layers = tuple(crf_layers)
+        self._entity_tag_types = entity_tag_types
+
+        self._max_number_of_tags = max(
+            crf_layer._number_of_tags for crf_layer in self._crf_layers)
+
+    def forward(
+            self,
+            rnn_outputs: Dict[EntityTagType, torch.Tensor],
+            lengths: torch.Tensor,
+            targets: Dict[EntityTagType, torch.Tensor],
+            mask: torch.Tensor) -> Tuple[Dict[EntityTagType, torch.Tensor], Dict[EntityTagType, torch.Tensor]]:
+        """
+        Calculate the negative log-likelihood for all heads
+        :param rnn_outputs: emission scores per entity tag type
+        :param lengths:
+        :param targets: targets per entity tag type
+        :param mask:
+        :return: the losses and the decoded tags per entity tag type
+        """
+        batch_size, max_length = mask.shape
+        number_of_heads = len(self._crf_layers)
+        crf_layer = self._crf_layers[0]
+
+        emissions = self._stack_emissions(rnn_outputs)
+        transition_matrix = self._stack_transition_matrices(batch_size)
+        stacked_lengths = lengths.repeat(number_of_heads)
+        stacked_targets = torch.cat([
+            targets[entity_tag_type] for entity_tag_type in self._entity_tag_types], dim=0)
+        stacked_mask = mask.repeat(number_of_heads, 1)
+
+        target_weights = None
+        if crf_layer.training and crf_layer.use_weighted_loss:
+            target_weights = self._stack_target_weights(targets)
+
+        # the start, stop and padding labels are the same for all heads,
+        # so the recursions of the first layer can be used on the stacked tensors
+        unlabeled_scores = crf_layer._forward_unlabeled_from_emissions(
+            emissions, transition_matrix, stacked_lengths, target_weights)
+        labeled_scores = crf_layer._forward_labeled_from_emissions(
+            emissions, transition_matrix, stacked_lengths, stacked_targets, stacked_mask, target_weights)
+        losses = unlabeled_scores.view(number_of_heads, batch_size).mean(dim=1) - \
+            labeled_scores.view(number_of_heads, batch_size).mean(dim=1)
+
+        _, decoded_tags = crf_layer._viterbi_decode_from_emissions(
+            emissions, transition_matrix, stacked_lengths)
+        decoded_tags = decoded_tags.view(number_of_heads, batch_size, max_length)
+
+        losses_per_tag = {
+            entity_tag_type: losses[i]
+            for i, entity_tag_type in enumerate(self._entity_tag_types)
+        }
+
+        predictions_per_tag = {
+            entity_tag_type: decoded_tags[i]
+            for i, entity_tag_type in enumerate(self._entity_tag_types)
+        }
+
+        return losses_per_tag, predictions_per_tag
+
+    def decode(
+            self,
+            rnn_outputs: Dict[EntityTagType, torch.Tensor],
+            lengths: torch.Tensor) -> Dict[EntityTagType, torch.Tensor]:
+        """
+        Decode the batch input for all heads
+        :param rnn_outputs: emission scores per entity tag type
+        :param lengths:
+        :return: the decoded tags per entity tag type
+        """
+        batch_size, max_length, _ = rnn_outputs[self._entity_tag_types[0]].shape
+        number_of_heads = len(self._crf_layers)
+
+        emissions = self._stack_emissions(rnn_outputs)
+        transition_matrix = self._stack_transition_matrices(batch_size)
+
+        _, decoded_tags = self._crf_layers[0]._viterbi_decode_from_emissions(
+            emissions, transition_matrix, lengths.repeat(number_of_heads))
+        decoded_tags = decoded_tags.view(number_of_heads, batch_size, max_length)
+
+        result = {
+            entity_tag_type: decoded_tags[i]
+            for i, entity_tag_type in enumerate(self._entity_tag_types)
+        }
+
+        return result
+
+    def _stack_emissions(
+            self,
+            rnn_outputs: Dict[EntityTagType, torch.Tensor]) -> torch.Tensor:
+        """
+        Pad the emissions of all heads to the same number of tags and stack them over the batch dimension
+        :param rnn_outputs: emission scores per entity tag type (batch_size x max_length x number_of_tags)
+        :return: (number_of_heads * batch_size x max_length x max_number_of_tags)
+        """
+        emissions = torch.cat([
+            F.pad(
+                rnn_outputs[entity_tag_type],
+                (0, self._max_number_of_tags - crf_layer._number_of_tags),
+                value=self._padding_score)
+            for entity_tag_type, crf_layer in zip(self._entity_tag_types, self._crf_layers)
+        ], dim=0)
+
+        return emissions
+
+    def _stack_transition_matrices(
+            self,
+            batch_size: int) -> torch.Tensor:
+        """
+        Pad the transition matrices of all heads so that the padded tags are never reachable
+        and repeat them for every sequence of the head
+        :param batch_size:
+        :return: (number_of_heads * batch_size x max_number_of_tags x max_number_of_tags)
+        """
+        transition_matrices = torch.stack([
+            F.pad(
+                crf_layer._transition_matrix,
+                (0, self._max_number_of_tags - crf_layer._number_of_tags,
+                 0, self._max_number_of_tags - crf_layer._number_of_tags),
+                value=self._padding_score)
+            for crf_layer in self._crf_layers
+        ], dim=0)
+
+        transition_matrices = transition_matrices.repeat_interleave(
+            batch_size, dim=0)
+        return transition_matrices
+
+    def _stack_target_weights(
+            self,
+            targets: Dict[EntityTagType, torch.Tensor]) -> torch.Tensor:
+        """
+        Look up the weights of the weighted loss for the targets of all heads
+        :param targets: targets per entity tag type (batch_size x max_length)
+        :return: (number_of_heads * batch_size x max_length x max_number_of_tags)
+        """
+        target_weights = torch.cat([
+            F.pad(
+                crf_layer._weighted_loss_matrix[targets[entity_tag_type]],
+                (0, self._max_number_of_tags - crf_layer._number_of_tags),
+                value=1.0)
+            for entity_tag_type, crf_layer in zip(self._entity_tag_types, self._crf_layers)
+        ], dim=0)
+
+        return target_weights
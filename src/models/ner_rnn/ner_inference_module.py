@@ -0,0 +1,69 @@
+import torch
+from torch import nn
+
+from typing import List, Tuple
+
+from entities.batch_representation import BatchRepresentation
+
+from models.ner_rnn.rnn_encoder import RNNEncoder
+from models.ner_rnn.conditional_random_field import ConditionalRandomField, viterbi_decode_from_emissions
+
+
+class NERInferenceModule(nn.Module):
+    """
+    The inference graph of a trained NERPredictor, taking only tensors so that it can be traced and exported.
+    Sequences can be given in any order, they are sorted for the RNN and the decoded labels are returned
+    in the original order, one tensor per entity tag type.
+    The Viterbi decoding is compiled with TorchScript, so that its loop over the sequence is kept when tracing
+    """
+
+    def __init__(
+            self,
+            rnn_encoder: RNNEncoder,
+            crf_layers: List[ConditionalRandomField],
+            device: str,
+            use_character_sequences: bool,
+            use_manual_features: bool):
+        super().__init__()
+
+        self._rnn_encoder = rnn_encoder
+        self._crf_layers = nn.ModuleList(crf_layers)
+        self._device = device
+        self._use_character_sequences = use_character_sequences
+        self._use_manual_features = use_manual_features
+
+        self._viterbi_decode = torch.jit.script(viterbi_decode_from_emissions)
+
+    def forward(
+            self,
+            subword_sequences: torch.Tensor,
+            subword_lengths: torch.Tensor,
+            character_sequences: torch.Tensor,
+            subword_characters_count: torch.Tensor,
+            manual_features: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+        _, sort_indices = subword_lengths.sort(descending=True)
+        _, restore_indices = sort_indices.sort()
+
+        batch_representation = BatchRepresentation.from_tensors(
+            device=self._device,
+            subword_sequences=subword_sequences[sort_indices],
+            subword_lengths=subword_lengths[sort_indices],
+            character_sequences=character_sequences[sort_indices] if self._use_character_sequences else None,
+            subword_characters_count=subword_characters_count[sort_indices] if self._use_character_sequences else None,
+            manual_features=manual_features[sort_indices] if self._use_manual_features else None)
+
+        rnn_outputs, lengths = self._rnn_encoder.forward(batch_representation)
+
+        predictions = []
+        for crf_layer, rnn_output in zip(self._crf_layers, rnn_outputs.values()):
+            _, decoded_tags = self._viterbi_decode(
+                rnn_output,
+                crf_layer._transition_matrix,
+                lengths,
+                crf_layer.start_idx,
+                crf_layer.end_idx,
+                crf_layer.pad_idx)
+
+            predictions.append(decoded_tags[restore_indices])
+
+        return tuple(predictions)
@@ -21,6 +21,8 @@ from enums.word_feature import WordFeature
 
 from models.ner_rnn.rnn_encoder import RNNEncoder
 from models.ner_rnn.conditional_random_field import ConditionalRandomField
+from models.ner_rnn.fused_conditional_random_field import FusedConditionalRandomField
+from models.ner_rnn.ner_inference_module import NERInferenceModule
 from models.model_base import ModelBase
 
 from services.arguments.ner_arguments_service import NERArgumentsService
@@ -61,6 +63,10 @@ class NERPredictor(ModelBase):
 
         self._evaluation_mode = arguments_service.evaluate
 
+        self._training_metrics_frequency = arguments_service.training_metrics_frequency
+        self._training_metrics_sample_ratio = arguments_service.training_metrics_sample_ratio
+        self._training_batches_count = 0
+
         pretrained_options = PretrainedRepresentationsOptions(
             include_pretrained_model=arguments_service.include_pretrained_model,
             pretrained_model_size=arguments_service.pretrained_model_size,
@@ -71,7 +77,8 @@ class NERPredictor(ModelBase):
             fine_tune_after_convergence=arguments_service.fine_tune_after_convergence,
             include_fasttext_model=arguments_service.include_fasttext_model,
             fasttext_model=arguments_service.fasttext_model,
-            fasttext_model_size=arguments_service.fasttext_model_size)
+            fasttext_model_size=arguments_service.fasttext_model_size,
+            unpad_pretrained_inputs=arguments_service.unpad_pretrained_inputs)
 
         rnn_encoder_options = RNNEncoderOptions(
             device=self.device,
@@ -116,10 +123,20 @@ class NERPredictor(ModelBase):
                 pad_token_id=self._pad_idx,
                 none_id=self._process_service.get_entity_label(
                     'O', entity_tag_type),
-                use_weighted_loss=arguments_service.use_weighted_loss)
+                use_weighted_loss=arguments_service.use_weighted_loss,
+                memory_efficient=arguments_service.memory_efficient_crf)
             for i, (entity_tag_type, number_of_tags) in enumerate(self.number_of_tags.items())
         ])
 
+        self._fused_crf_layer = None
+        if arguments_service.fuse_crf_layers and len(self._entity_tag_types) > 1:
+            self._fused_crf_layer = FusedConditionalRandomField(
+                data_service,
+                arguments_service,
+                log_service,
+                crf_layers=list(self._crf_layers),
+                entity_tag_types=self._entity_tag_types)
+
         self.metric_log_key = self._create_measure_key(
             TagMetric.F1ScoreMicro,
             TagMeasureType.Partial,
@@ -133,11 +150,21 @@ class NERPredictor(ModelBase):
             for entity_tag_type in self._entity_tag_types
         }
 
+        # named entities are parsed straight from the labels, without converting them to tags first
+        self._label_lookups = {
+            entity_tag_type: self._tag_metrics_service.create_label_lookup(
+                *self._process_service.get_entities_by_label(entity_tag_type))
+            for entity_tag_type in self._entity_tag_types
+        }
+
     @overrides
     def forward(self, batch_representation: BatchRepresentation):
         rnn_outputs, lengths = self.rnn_encoder.forward(
             batch_representation)
 
+        if self._fused_crf_layer is not None:
+            return self._forward_fused(batch_representation, rnn_outputs, lengths)
+
         losses: Dict[EntityTagType, torch.Tensor] = {}
         predictions: Dict[EntityTagType, torch.Tensor] = {}
 
@@ -156,6 +183,22 @@ class NERPredictor(ModelBase):
 
         return predictions, losses, lengths
 
+    def _forward_fused(
+            self,
+            batch_representation: BatchRepresentation,
+            rnn_outputs: Dict[EntityTagType, torch.Tensor],
+            lengths: torch.Tensor):
+        if self._evaluation_mode:
+            predictions = self._fused_crf_layer.decode(rnn_outputs, lengths)
+            return predictions, {}, lengths
+
+        mask = self._create_mask(
+            rnn_outputs[self._entity_tag_types[0]], lengths)
+        losses, predictions = self._fused_crf_layer.forward(
+            rnn_outputs, lengths, batch_representation.targets, mask)
+
+        return predictions, losses, lengths
+
     def calculate_accuracies(
             self,
             batch: BatchRepresentation,
@@ -170,38 +213,54 @@ class NERPredictor(ModelBase):
         if output_characters:
             output_log = DataOutputLog()
 
+        if self.training:
+            # skipped batches return no metrics so that the last calculated ones are kept,
+            # and no predictions are copied from the device
+            if not self._should_calculate_training_metrics():
+                return metrics, output_log
+
+            if self._training_metrics_sample_ratio is not None:
+                output, targets, lengths = self._sample_sequences(
+                    output, targets, lengths, self._training_metrics_sample_ratio)
+
         for entity_tag_type in self._entity_tag_types:
 
             predictions = output[entity_tag_type].cpu().detach().numpy()
             current_targets = targets[entity_tag_type].cpu().detach().numpy()
 
-            prediction_tags = []
-            target_tags = []
-            for b in range(batch.batch_size):
-                current_prediction_tags = [self._process_service.get_entity_by_label(
-                    token, entity_tag_type) for token in predictions[b][:lengths[b]] if token != self._pad_idx]
-                prediction_tags.append(current_prediction_tags)
+            # padding is dropped, both after the sequence lengths and inside them
+            prediction_mask = self._create_mask(
+                output[entity_tag_type], lengths).cpu().numpy() & (predictions != self._pad_idx)
+            target_mask = self._create_mask(
+                targets[entity_tag_type], lengths).cpu().numpy() & (current_targets != self._pad_idx)
 
-                current_target_tags = [self._process_service.get_entity_by_label(
-                    token, entity_tag_type) for token in current_targets[b][:lengths[b]] if token != self._pad_idx]
-                target_tags.append(current_target_tags)
+            label_lookup = self._label_lookups[entity_tag_type]
+            predicted_named_entities = self._tag_metrics_service.get_named_entities_from_labels(
+                predictions, prediction_mask, label_lookup)
+            true_named_entities = self._tag_metrics_service.get_named_entities_from_labels(
+                current_targets, target_mask, label_lookup)
 
             if self.training:
-                results, results_per_type = self._tag_metrics_service.calculate_batch(
-                    prediction_tags, target_tags, self._main_entities_per_tag[entity_tag_type])
+                results, results_per_type = self._tag_metrics_service.calculate_batch_from_entities(
+                    predicted_named_entities, true_named_entities, self._main_entities_per_tag[entity_tag_type])
                 self.update_metrics(results, results_per_type,
                                     metrics, entity_tag_type)
             else:
-                self._tag_metrics_service.add_predictions(
-                    prediction_tags,
-                    target_tags,
+                self._tag_metrics_service.add_predicted_entities(
+                    predicted_named_entities,
+                    true_named_entities,
                     self._main_entities_per_tag[entity_tag_type],
                     entity_tag_type)
 
             if output_characters:
-                for b in range(batch.batch_size):
-                    predicted_string = ','.join(prediction_tags[b])
-                    target_string = ','.join(target_tags[b])
+                all_prediction_tags = self._process_service.labels_to_tags(
+                    predictions, entity_tag_type)
+                all_target_tags = self._process_service.labels_to_tags(
+                    current_targets, entity_tag_type)
+
+                for b in range(len(predictions)):
+                    predicted_string = ','.join(all_prediction_tags[b][prediction_mask[b]])
+                    target_string = ','.join(all_target_tags[b][target_mask[b]])
 
                     output_log.add_new_data(
                         output_data=predicted_string,
@@ -209,6 +268,55 @@ class NERPredictor(ModelBase):
 
         return metrics, output_log
 
+    @overrides
+    def quantize(self, quantize_pretrained_model: bool, quantize_rnn_encoder: bool):
+        self.rnn_encoder.quantize(quantize_pretrained_model, quantize_rnn_encoder)
+
+    @overrides
+    def create_inference_module(self) -> nn.Module:
+        inference_module = NERInferenceModule(
+            rnn_encoder=self.rnn_encoder,
+            crf_layers=list(self._crf_layers),
+            device=self.device,
+            use_character_sequences=self._arguments_service.learn_character_embeddings,
+            use_manual_features=self._arguments_service.use_manual_features)
+
+        return inference_module
+
+    def _should_calculate_training_metrics(self) -> bool:
+        batch_index = self._training_batches_count
+        self._training_batches_count += 1
+
+        if not self._training_metrics_frequency:
+            return False
+
+        return batch_index % self._training_metrics_frequency == 0
+
+    def _sample_sequences(
+            self,
+            output: Dict[EntityTagType, torch.Tensor],
+            targets: Dict[EntityTagType, torch.Tensor],
+            lengths: torch.Tensor,
+            sample_ratio: float) -> Tuple[Dict[EntityTagType, torch.Tensor], Dict[EntityTagType, torch.Tensor], torch.Tensor]:
+        batch_size = lengths.size(0)
+        sample_size = min(batch_size, max(1, int(round(batch_size * sample_ratio))))
+        if sample_size == batch_size:
+            return output, targets, lengths
+
+        sample_indices = torch.randperm(batch_size, device=lengths.device)[:sample_size]
+
+        sampled_output = {
+            entity_tag_type: output[entity_tag_type][sample_indices]
+            for entity_tag_type in self._entity_tag_types
+        }
+
+        sampled_targets = {
+            entity_tag_type: targets[entity_tag_type][sample_indices]
+            for entity_tag_type in self._entity_tag_types
+        }
+
+        return sampled_output, sampled_targets, lengths[sample_indices]
+
     def update_metrics(self, results, results_per_type, metrics, entity_tag_type):
         training_metrics = [TagMetric.F1ScoreMicro,
                             TagMetric.PrecisionMicro,
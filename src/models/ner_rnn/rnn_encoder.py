@@ -25,6 +25,8 @@ from services.file_service import FileService
 from overrides import overrides
 from models.model_base import ModelBase
 
+from utils.tensor_utils import scatter_mean
+
 
 class RNNEncoder(ModelBase):
     def __init__(
@@ -128,9 +130,9 @@ class RNNEncoder(ModelBase):
 
         if self._merge_subword_embeddings:
             rnn_output, batch_representation._subword_lengths = self._restore_position_changes(
-                position_changes=batch_representation.position_changes,
-                embeddings=rnn_output,
-                lengths=batch_representation.subword_lengths)
+                position_change_indices=batch_representation.position_change_indices,
+                merged_lengths=batch_representation.merged_lengths,
+                embeddings=rnn_output)
 
         outputs: Dict[EntityTagType, torch.Tensor] = {}
         for i, entity_tag_type in enumerate(self._entity_tag_types):
@@ -139,30 +141,43 @@ class RNNEncoder(ModelBase):
 
         return outputs, batch_representation.subword_lengths
 
+    @overrides
+    def quantize(self, quantize_pretrained_model: bool, quantize_rnn_encoder: bool):
+        if quantize_pretrained_model:
+            self._embedding_layer.quantize(quantize_pretrained_model, quantize_rnn_encoder)
+
+        if quantize_rnn_encoder:
+            torch.quantization.quantize_dynamic(
+                self,
+                {
+                    'rnn': torch.quantization.default_dynamic_qconfig,
+                    '_output_layers': torch.quantization.default_dynamic_qconfig
+                },
+                dtype=torch.qint8,
+                inplace=True)
+
     def _restore_position_changes(
             self,
-            position_changes,
-            embeddings,
-            lengths):
+            position_change_indices: torch.Tensor,
+            merged_lengths: torch.Tensor,
+            embeddings: torch.Tensor):
         batch_size, sequence_length, embeddings_size = embeddings.shape
 
-        new_max_sequence_length = max(
-            [len(x.keys()) for x in position_changes])
+        assert position_change_indices.shape[1] == sequence_length, f'position changes cover {position_change_indices.shape[1]} subwords but the sequences have {sequence_length}'
 
-        merged_rnn_output = torch.zeros(
-            (batch_size, new_max_sequence_length, embeddings_size), dtype=embeddings.dtype).to(self._device)
-        new_lengths = torch.zeros(
-            (batch_size), dtype=lengths.dtype).to(self._device)
+        new_max_sequence_length = int(merged_lengths.max())
 
-        for i, current_position_changes in enumerate(position_changes):
-            new_lengths[i] = len(current_position_changes.keys())
+        # offset the merged positions of every sequence so that all of them are merged at once
+        sequence_offsets = torch.arange(
+            batch_size, device=position_change_indices.device).unsqueeze(-1) * new_max_sequence_length
+        flat_indices = torch.where(
+            position_change_indices >= 0,
+            position_change_indices + sequence_offsets,
+            position_change_indices)
 
-            for old_position, new_positions in current_position_changes.items():
-                if len(new_positions) == 1:
-                    merged_rnn_output[i, old_position,
-                                   :] = embeddings[i, new_positions[0], :]
-                else:
-                    merged_rnn_output[i, old_position, :] = torch.mean(
-                        embeddings[i, new_positions], dim=0)
+        merged_rnn_output = scatter_mean(
+            embeddings.reshape(-1, embeddings_size),
+            flat_indices.view(-1),
+            batch_size * new_max_sequence_length).view(batch_size, new_max_sequence_length, embeddings_size)
 
-        return merged_rnn_output, new_lengths
\ No newline at end of file
+        return merged_rnn_output, merged_lengths
\ No newline at end of file
@@ -7,6 +7,8 @@ from transformers import PreTrainedModel, BertModel, CamembertModel
 import torch
 from torch import nn
 
+from typing import Tuple
+
 from overrides import overrides
 
 from services.file_service import FileService
@@ -17,6 +19,60 @@ from enums.pretrained_model import PretrainedModel
 
 from models.model_base import ModelBase
 
+
+def get_window_positions(
+        input: torch.Tensor,
+        lengths: torch.Tensor,
+        max_length: int,
+        overlap_size: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Get the windows every sequence is split into, based on its own length, the same as `get_split_indices` does.
+    Sequences which fit in the maximum length are kept as one window.
+    All sequences share the same grid of window offsets, and the mask marks which items of a window belong to each sequence.
+    Kept free of module state so that it can be compiled with TorchScript
+    :param input: the padded sequences (batch_size x sequence_length)
+    :param lengths: the length of every sequence (batch_size)
+    :param max_length: the maximum length of a window
+    :param overlap_size: the amount of positions consecutive windows share
+    :return: the position of every window item (windows_count x window_width), clamped to the sequence length,
+             along with the mask of the items which are part of the windows of every sequence (batch_size x windows_count x window_width)
+    """
+    sequence_length = input.shape[1]
+    window_size = max_length - (overlap_size * 2)
+    step = window_size - overlap_size
+
+    windows_count = 1
+    if sequence_length > max_length:
+        while (windows_count - 1) * step + window_size < sequence_length:
+            windows_count += 1
+
+    window_width = min(sequence_length, max_length)
+    window_indices = torch.arange(windows_count, device=input.device)
+    start_offsets = window_indices * step
+    positions = start_offsets.unsqueeze(-1) + torch.arange(window_width, device=input.device)
+
+    # sequences which fit are one window, longer ones have windows until one reaches their end
+    long_sequences = lengths > max_length
+    sequence_windows_count = torch.where(
+        long_sequences,
+        torch.div(lengths - window_size + step - 1, step, rounding_mode='floor') + 1,
+        torch.ones_like(lengths))
+
+    window_lengths = torch.where(
+        long_sequences.unsqueeze(-1),
+        (lengths.unsqueeze(-1) - start_offsets.unsqueeze(0)).clamp(max=window_size),
+        lengths.unsqueeze(-1).expand(-1, windows_count))
+
+    window_lengths = torch.where(
+        window_indices.unsqueeze(0) < sequence_windows_count.unsqueeze(-1),
+        window_lengths,
+        torch.zeros_like(window_lengths))
+
+    window_mask = torch.arange(window_width, device=input.device).view(1, 1, -1) < window_lengths.unsqueeze(-1)
+
+    return positions.clamp(max=sequence_length - 1), window_mask
+
+
 class PretrainedRepresentationsLayer(ModelBase):
     def __init__(
             self,
@@ -36,6 +92,7 @@ class PretrainedRepresentationsLayer(ModelBase):
         self._pretrained_model_size = pretrained_representations_options.pretrained_model_size
         self._pretrained_weights = pretrained_representations_options.pretrained_weights
         self._pretrained_max_length = pretrained_representations_options.pretrained_max_length
+        self._unpad_inputs = pretrained_representations_options.unpad_pretrained_inputs
         self._pretrained_model: PreTrainedModel = None
 
         self._fine_tune_pretrained = pretrained_representations_options.fine_tune_pretrained
@@ -65,37 +122,141 @@ class PretrainedRepresentationsLayer(ModelBase):
             self._fasttext_dimension = pretrained_representations_options.fasttext_model_size
             self._fasttext_model = fasttext.load_model(fasttext_path)
 
-    def get_pretrained_representation(self, input):
+    def get_pretrained_representation(self, input: torch.Tensor, lengths: torch.Tensor = None):
         if self._pretrained_model is None:
             return []
 
-        if input.shape[1] > self._pretrained_max_length:
-            overlap_size = 5
-            window_size = self._pretrained_max_length - (overlap_size * 2)
-            offset_pairs = self.get_split_indices(input.shape[1], window_size, overlap_size)
-            result_tensor = torch.zeros(input.shape[0], input.shape[1], self._pretrained_model_size, device=input.device)
-
-            for (start_offset, end_offset) in offset_pairs:
-                current_input = input[:, start_offset:end_offset]
-                current_output = self._pretrained_model.forward(current_input)
-                current_representations = current_output[0]
-
-                if start_offset > 0:
-                    result_tensor[:, start_offset+overlap_size:end_offset] = current_representations[:, overlap_size:]
-                    # we get the mean of the overlapping representations
-                    result_tensor[:, start_offset:start_offset+overlap_size] = torch.mean(
-                        torch.stack([
-                            result_tensor[:, start_offset:start_offset+overlap_size].clone(),
-                            current_representations[:, :overlap_size]]))
-                else:
-                    result_tensor[:, :end_offset] = current_representations
-
+        batch_size, sequence_length = input.shape
+        if lengths is None:
+            lengths = torch.full((batch_size,), sequence_length, dtype=torch.long, device=input.device)
         else:
-            output = self._pretrained_model.forward(input)
-            result_tensor = output[0]
+            lengths = lengths.to(input.device)
+
+        if self._unpad_inputs:
+            return self._get_packed_representation(input, lengths)
 
+        result_tensor = self._get_windowed_representation(input, lengths)
         return result_tensor
 
+    def _get_windowed_representation(
+            self,
+            input: torch.Tensor,
+            lengths: torch.Tensor,
+            overlap_size: int = 5) -> torch.Tensor:
+        """
+        Split sequences longer than the pre-trained model allows into overlapping windows and encode
+        the windows of all sequences with one call. Sequences which fit are encoded as a single window.
+        The windows of every sequence depend only on its own length, and positions after its end are masked out,
+        so that the representations do not change with the other sequences of the batch.
+        The representation of every position is the mean over the windows that contain it
+        """
+        batch_size, sequence_length = input.shape
+
+        # while tracing, the windows are computed by TorchScript so that their amount is not fixed to the example batch
+        window_positions_function = get_window_positions
+        if torch.jit.is_tracing():
+            window_positions_function = torch.jit.script(get_window_positions)
+
+        positions, window_mask = window_positions_function(input, lengths, self._pretrained_max_length, overlap_size)
+
+        # only the windows with items of a sequence are encoded, and at least one
+        # so that a batch of empty sequences still makes a valid call
+        used_windows = window_mask.any(dim=-1)
+        used_windows[0, 0] = used_windows[0, 0] | ~used_windows.any()
+        windows_mask = window_mask[used_windows]
+        windows_output = self._pretrained_model.forward(
+            input[:, positions][used_windows],
+            attention_mask=windows_mask.long())
+        windows_representations = windows_output[0]
+
+        flat_positions = torch.arange(batch_size, device=input.device).view(-1, 1, 1) * sequence_length + positions.unsqueeze(0)
+        valid_positions = flat_positions[used_windows][windows_mask]
+        result_tensor = torch.zeros(
+            (batch_size * sequence_length, windows_representations.shape[-1]),
+            dtype=windows_representations.dtype,
+            device=input.device).index_add(0, valid_positions, windows_representations[windows_mask])
+
+        windows_per_position = torch.bincount(valid_positions, minlength=batch_size * sequence_length).clamp(min=1)
+        result_tensor = result_tensor / windows_per_position.unsqueeze(-1).to(result_tensor.dtype)
+
+        return result_tensor.view(batch_size, sequence_length, -1)
+
+    def _get_packed_representation(
+            self,
+            input: torch.Tensor,
+            lengths: torch.Tensor,
+            overlap_size: int = 5) -> torch.Tensor:
+        """
+        Encode only the real subwords of the sequences. Every sequence, split into overlapping windows if it is
+        longer than the pre-trained model allows, is packed with others into rows of at most the maximum length.
+        Attention is restricted to the same segment and positions restart in every segment,
+        so that the computation scales with the amount of real subwords instead of the padded batch size
+        """
+        batch_size, sequence_length = input.shape
+        window_size = self._pretrained_max_length - (overlap_size * 2)
+
+        segments = []
+        for sequence_idx, length in enumerate(lengths.tolist()):
+            if length > self._pretrained_max_length:
+                segments.extend([
+                    (sequence_idx, start_offset, end_offset)
+                    for start_offset, end_offset in self.get_split_indices(length, window_size, overlap_size)])
+            elif length > 0:
+                segments.append((sequence_idx, 0, length))
+
+        # longest segments first, each placed in the first row with enough space left
+        rows = []
+        rows_lengths = []
+        for segment in sorted(segments, key=lambda x: x[2] - x[1], reverse=True):
+            segment_length = segment[2] - segment[1]
+            row_idx = next(
+                (i for i, row_length in enumerate(rows_lengths) if row_length + segment_length <= self._pretrained_max_length),
+                len(rows))
+
+            if row_idx == len(rows):
+                rows.append([])
+                rows_lengths.append(0)
+
+            rows[row_idx].append(segment)
+            rows_lengths[row_idx] += segment_length
+
+        if len(rows) == 0:
+            return torch.zeros((batch_size, sequence_length, self._pretrained_model_size), device=input.device)
+
+        row_length = max(rows_lengths)
+        source_indices = torch.zeros((len(rows), row_length), dtype=torch.long)
+        position_ids = torch.zeros((len(rows), row_length), dtype=torch.long)
+        segment_ids = torch.full((len(rows), row_length), -1, dtype=torch.long)
+        for row_idx, row_segments in enumerate(rows):
+            row_offset = 0
+            for segment_idx, (sequence_idx, start_offset, end_offset) in enumerate(row_segments):
+                row_end = row_offset + end_offset - start_offset
+                source_indices[row_idx, row_offset:row_end] = (sequence_idx * sequence_length) + torch.arange(start_offset, end_offset)
+                position_ids[row_idx, row_offset:row_end] = torch.arange(end_offset - start_offset)
+                segment_ids[row_idx, row_offset:row_end] = segment_idx
+                row_offset = row_end
+
+        source_indices = source_indices.to(input.device)
+        segment_ids = segment_ids.to(input.device)
+        real_mask = segment_ids >= 0
+
+        attention_mask = (segment_ids.unsqueeze(-1) == segment_ids.unsqueeze(-2)) & real_mask.unsqueeze(-2)
+        rows_output = self._pretrained_model.forward(
+            input.view(-1)[source_indices],
+            attention_mask=attention_mask.unsqueeze(1),
+            position_ids=position_ids.to(input.device))
+        rows_representations = rows_output[0]
+
+        valid_indices = source_indices[real_mask]
+        result_tensor = torch.zeros(
+            (batch_size * sequence_length, rows_representations.shape[-1]),
+            dtype=rows_representations.dtype,
+            device=input.device).index_add(0, valid_indices, rows_representations[real_mask])
+
+        segments_per_position = torch.bincount(valid_indices, minlength=batch_size * sequence_length).clamp(min=1)
+        result_tensor = result_tensor / segments_per_position.unsqueeze(-1).to(result_tensor.dtype)
+        return result_tensor.view(batch_size, sequence_length, -1)
+
     def get_split_indices(self, full_length: int, window_size: int, overlap_size=5):
 
         offset_pairs = []
@@ -134,6 +295,14 @@ class PretrainedRepresentationsLayer(ModelBase):
 
         return fasttext_tensor
 
+    @overrides
+    def quantize(self, quantize_pretrained_model: bool, quantize_rnn_encoder: bool):
+        if quantize_pretrained_model and self._pretrained_model is not None:
+            self._pretrained_model = torch.quantization.quantize_dynamic(
+                self._pretrained_model,
+                {nn.Linear},
+                dtype=torch.qint8)
+
     @property
     @overrides
     def keep_frozen(self) -> bool:
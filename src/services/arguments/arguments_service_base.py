@@ -64,6 +64,14 @@ class ArgumentsServiceBase:
                             metavar="S", help="random seed (default: 42)")
         parser.add_argument("--evaluate", action='store_true',
                             help="run in evaluation mode")
+        parser.add_argument("--quantize-pretrained-model", action='store_true',
+                            help="Apply dynamic int8 quantization to the linear layers of the pre-trained model in evaluation mode. Only supported on CPU")
+        parser.add_argument("--quantize-rnn-encoder", action='store_true',
+                            help="Apply dynamic int8 quantization to the LSTM and output layers of the RNN encoder in evaluation mode. Only supported on CPU")
+        parser.add_argument("--quantization-report", action='store_true',
+                            help="Before testing, compare the speed and the metrics of the full precision and the quantized model on the validation set")
+        parser.add_argument("--export-model", action='store_true',
+                            help="Export the best checkpoint as a single TorchScript file for inference, instead of training or testing")
         parser.add_argument("--patience", type=int, default=30,
                             help="how long will the model wait for improvement before stopping training")
         parser.add_argument("--consider-equal-results-as-worse", action='store_true',
@@ -92,6 +100,8 @@ class ArgumentsServiceBase:
                             help='folder where data will be taken from')
         parser.add_argument("--cache-folder", type=str, default='.cache',
                             help='folder where cache will be taken from')
+        parser.add_argument("--memory-cache-size", type=int, default=1024,
+                            help='Size in megabytes of the in-memory cache kept in front of the cache folder. Memory-mapped arrays of cached items are not counted. Least recently used items are evicted when it is exceeded, 0 disables it')
         parser.add_argument("--experiments-folder", type=str, default='experiments',
                             help='folder where experiments results will be saved to')
         parser.add_argument("--output-folder", type=str, default='results',
@@ -108,6 +118,18 @@ class ArgumentsServiceBase:
                             help='What metrics should be calculated. Default is only Jaccard similarity')
         parser.add_argument('--joint-model', action='store_true',
                             help='If a joint model should be used instead of a single one')
+        parser.add_argument("--bucket-by-length", action='store_true',
+                            help="If set, shuffled training batches will be formed from items of similar length to lower the padding. The order of the batches is still random every epoch")
+        parser.add_argument('--max-batch-tokens', type=int, default=None,
+                            help="If set together with bucketing by length, training batches are capped by this amount of tokens including padding instead of by the batch size")
+        parser.add_argument('--dataloader-workers', type=int, default=0,
+                            help="Number of worker processes used to load and pad the batches. Default is `0` which loads them in the main process")
+        parser.add_argument("--pin-memory", action='store_true',
+                            help="If set, batches are put in pinned memory so that they can be copied to the device without blocking")
+        parser.add_argument('--prefetch-factor', type=int, default=None,
+                            help="Number of batches loaded in advance by each worker. Only used with data loader workers")
+        parser.add_argument("--persistent-workers", action='store_true',
+                            help="If set, data loader workers are kept alive between epochs. Only used with data loader workers")
         parser.add_argument('--joint-model-amount', type=int, default=2,
                             help='How many models should be trained jointly')
         parser.add_argument('--enable-external-logging', action='store_true',
@@ -191,6 +213,22 @@ class ArgumentsServiceBase:
     def evaluate(self) -> bool:
         return self._get_argument('evaluate')
 
+    @property
+    def quantize_pretrained_model(self) -> bool:
+        return self._get_argument('quantize_pretrained_model')
+
+    @property
+    def quantize_rnn_encoder(self) -> bool:
+        return self._get_argument('quantize_rnn_encoder')
+
+    @property
+    def quantization_report(self) -> bool:
+        return self._get_argument('quantization_report')
+
+    @property
+    def export_model(self) -> bool:
+        return self._get_argument('export_model')
+
     @property
     def patience(self) -> int:
         return self._get_argument('patience')
@@ -207,6 +245,30 @@ class ArgumentsServiceBase:
     def shuffle(self) -> bool:
         return self._get_argument('shuffle')
 
+    @property
+    def bucket_by_length(self) -> bool:
+        return self._get_argument('bucket_by_length')
+
+    @property
+    def max_batch_tokens(self) -> int:
+        return self._get_argument('max_batch_tokens')
+
+    @property
+    def dataloader_workers(self) -> int:
+        return self._get_argument('dataloader_workers')
+
+    @property
+    def pin_memory(self) -> bool:
+        return self._get_argument('pin_memory')
+
+    @property
+    def prefetch_factor(self) -> int:
+        return self._get_argument('prefetch_factor')
+
+    @property
+    def persistent_workers(self) -> bool:
+        return self._get_argument('persistent_workers')
+
     @property
     def learning_rate(self) -> float:
         return self._get_argument('learning_rate')
@@ -258,6 +320,10 @@ class ArgumentsServiceBase:
     def cache_folder(self) -> str:
         return self._get_argument('cache_folder')
 
+    @property
+    def memory_cache_size(self) -> int:
+        return self._get_argument('memory_cache_size')
+
     @property
     def output_folder(self) -> str:
         return self._get_argument('output_folder')
@@ -57,6 +57,20 @@ class NERArgumentsService(PretrainedArgumentsService):
                             help="If set to true, CRF layer will use weighted loss which focuses more on non-empty tags")
         parser.add_argument("--use-manual-features", action='store_true',
                             help="If set to true, manual features representations will be learned and added to general embeddings")
+        parser.add_argument("--memory-efficient-crf", action='store_true',
+                            help="If set to true, CRF layer will compute the edge scores per position instead of materializing them for the whole batch. Lowers peak memory for long sequences")
+        parser.add_argument("--fuse-crf-layers", action='store_true',
+                            help="If set to true, the CRF layers of all entity tag types will be computed together in one batched pass")
+        parser.add_argument("--no-columnar-ne-collection", action='store_true',
+                            help="If set to true, the processed NER data will be kept in per-line lists and pickled. By default it is stored in concatenated arrays with interned tags, which are cached as memory-mapped files")
+        parser.add_argument('--preprocessing-batch-size', type=int, default=None,
+                            help="If set, the NER data files will be split into documents first and the documents will be tokenized in batches of this size")
+        parser.add_argument('--preprocessing-workers', type=int, default=1,
+                            help="Number of processes used to create the document lines when preprocessing in batches")
+        parser.add_argument('--training-metrics-frequency', type=int, default=1,
+                            help="Tagging metrics of training batches will be calculated only every N batches. Set to 0 to never calculate them during training")
+        parser.add_argument('--training-metrics-sample-ratio', type=float, default=None,
+                            help="If set, the tagging metrics of training batches will be calculated on a random sample of this ratio of the batch sequences")
 
     @property
     def entity_tag_types(self) -> List[EntityTagType]:
@@ -94,6 +108,34 @@ class NERArgumentsService(PretrainedArgumentsService):
     def use_weighted_loss(self) -> int:
         return self._get_argument('use_weighted_loss')
 
+    @property
+    def memory_efficient_crf(self) -> bool:
+        return self._get_argument('memory_efficient_crf')
+
+    @property
+    def fuse_crf_layers(self) -> bool:
+        return self._get_argument('fuse_crf_layers')
+
+    @property
+    def columnar_ne_collection(self) -> bool:
+        return not self._get_argument('no_columnar_ne_collection')
+
+    @property
+    def preprocessing_batch_size(self) -> int:
+        return self._get_argument('preprocessing_batch_size')
+
+    @property
+    def preprocessing_workers(self) -> int:
+        return self._get_argument('preprocessing_workers')
+
+    @property
+    def training_metrics_frequency(self) -> int:
+        return self._get_argument('training_metrics_frequency')
+
+    @property
+    def training_metrics_sample_ratio(self) -> float:
+        return self._get_argument('training_metrics_sample_ratio')
+
     @property
     def use_manual_features(self) -> bool:
         return self._get_argument('use_manual_features')
@@ -41,6 +41,10 @@ class PretrainedArgumentsService(ArgumentsServiceBase):
                             help='If true, the loaded pre-trained model will be fine-tuned but only once the full model has converged. Default is `false`')
         parser.add_argument("--fine-tune-learning-rate", type=float, default=None,
                             help="Different learning rate to use for pre-trained model. If None is given, then the global learning rate will be used. Default is `None`.")
+        parser.add_argument('--unpad-pretrained-inputs', action='store_true',
+                            help='If true, only the real subwords of a batch are packed together and encoded by the pre-trained model, instead of the padded batch. Meant for inference on CPU. Default is `false`')
+        parser.add_argument('--precompute-pretrained-features', action='store_true',
+                            help='If true, the representations of the pre-trained model are computed once for all data and read from a memory-mapped cache during training. Only used while the pre-trained model is not fine-tuned. Default is `false`')
 
     @property
     def pretrained_weights(self) -> str:
@@ -88,4 +92,12 @@ class PretrainedArgumentsService(ArgumentsServiceBase):
 
     @property
     def fine_tune_learning_rate(self) -> float:
-        return self._get_argument('fine_tune_learning_rate')
\ No newline at end of file
+        return self._get_argument('fine_tune_learning_rate')
+
+    @property
+    def unpad_pretrained_inputs(self) -> bool:
+        return self._get_argument('unpad_pretrained_inputs')
+
+    @property
+    def precompute_pretrained_features(self) -> bool:
+        return self._get_argument('precompute_pretrained_features')
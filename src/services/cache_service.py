@@ -1,11 +1,15 @@
 from entities.cache.cache_options import CacheOptions
+from entities.cache.array_cache_item import ArrayCacheItem
 from enums.configuration import Configuration
 import os
+import json
 from services.log_service import LogService
 import time
 from datetime import datetime
+from collections import OrderedDict
+import numpy as np
 
-from typing import Any, Callable
+from typing import Any, Callable, Dict, Tuple
 import urllib.request
 
 from entities.timespan import Timespan
@@ -53,6 +57,14 @@ class CacheService:
             str(self._arguments_service.seed),
             create_if_missing=True)
 
+        # items that were already loaded or cached by this process are kept in memory,
+        # keyed by their path, until the size budget is exceeded and the least recently used are evicted
+        self._memory_cache: OrderedDict[str, Tuple[object, int, Dict[str, str]]] = OrderedDict()
+        self._memory_cache_size = 0
+        self._memory_cache_budget = self._arguments_service.memory_cache_size * 1024 * 1024
+        self._memory_cache_hits = 0
+        self._memory_cache_misses = 0
+
     def get_item_from_cache(
             self,
             cache_options: CacheOptions,
@@ -66,14 +78,24 @@ class CacheService:
         :return: The cached item
         :rtype: Any
         """
-        cached_object = None
+        cache_folder = self._get_cache_folder_path(cache_options)
+        cached_object = self._get_item_from_memory(cache_folder, cache_options)
+        if cached_object is not None:
+            return cached_object
+
         if self.item_exists(cache_options):
-            cache_folder = self._get_cache_folder_path(cache_options)
+            # try to get the cached object, array items are preferred over pickles
+            if self._data_service.check_array_object(cache_folder, cache_options.get_item_key()):
+                cached_object = self._data_service.load_array_obj(
+                    cache_folder,
+                    cache_options.get_item_key())
+            else:
+                cached_object = self._data_service.load_python_obj(
+                    cache_folder,
+                    cache_options.get_item_key())
 
-            # try to get the cached object
-            cached_object = self._data_service.load_python_obj(
-                cache_folder,
-                cache_options.get_item_key())
+            if cached_object is not None:
+                self._add_item_to_memory(cached_object, cache_folder, cache_options)
 
         if cached_object is None:
             # if the cached object does not exist we call the callback function to calculate it
@@ -85,13 +107,14 @@ class CacheService:
 
             self._log_service.log_debug(
                 'Cached object was not found or was expired. Executing callback function')
-            cached_object = callback_function()
-            self.cache_item(cached_object, cache_options)
+            cached_object = self.cache_item(callback_function(), cache_options)
 
         return cached_object
 
-    def cache_item(self, item: object, cache_options: CacheOptions, overwrite: bool = True):
-        """Cache item using the provided options
+    def cache_item(self, item: object, cache_options: CacheOptions, overwrite: bool = True) -> object:
+        """Cache item using the provided options.
+        Items that are array cache items are stored as `.npy` files and loaded memory-mapped, all others are pickled.
+        Once saved, array cache items are loaded back, so that the cached files are used instead of the original arrays
 
         :param item: The item to be cached
         :type item: object
@@ -99,25 +122,53 @@ class CacheService:
         :type cache_options: CacheOptions
         :param overwrite: Whether to overwrite an already existing cached item at the same location, defaults to True
         :type overwrite: bool, optional
+        :return: The item to be used from now on, which is the memory-mapped one for saved array cache items
+        :rtype: object
         """
         self._log_service.log_debug(
             f'Attempting to cached object item with key {cache_options.get_item_key()} [config-specific: {cache_options.configuration_specific} | challenge-specific: {cache_options.challenge_specific}]')
         if not overwrite and self.item_exists(cache_options):
-            return
+            return item
 
         cache_folder = self._get_cache_folder_path(cache_options)
-        saved = self._data_service.save_python_obj(
-            item,
-            cache_folder,
-            cache_options.get_item_key())
+        self._remove_item_from_memory(cache_folder, cache_options)
+
+        # the fingerprints of a previous item are removed first, so they never describe a different item
+        fingerprints_path = self._get_fingerprints_path(cache_folder, cache_options)
+        if os.path.exists(fingerprints_path):
+            os.remove(fingerprints_path)
+
+        if isinstance(item, ArrayCacheItem):
+            saved = self._data_service.save_array_obj(
+                item,
+                cache_folder,
+                cache_options.get_item_key())
+        else:
+            saved = self._data_service.save_python_obj(
+                item,
+                cache_folder,
+                cache_options.get_item_key())
+
+        if saved and cache_options.input_fingerprints is not None:
+            with open(fingerprints_path, 'w', encoding='utf-8') as fingerprints_file:
+                json.dump(cache_options.input_fingerprints, fingerprints_file)
+
+        if saved and isinstance(item, ArrayCacheItem):
+            loaded_item = self._data_service.load_array_obj(cache_folder, cache_options.get_item_key())
+            if loaded_item is not None:
+                item = loaded_item
 
         if saved:
+            self._add_item_to_memory(item, cache_folder, cache_options)
             self._log_service.log_debug('Object cached successfully')
         else:
             self._log_service.log_debug('Object was not cached successfully')
 
+        return item
+
     def item_exists(self, cache_options: CacheOptions) -> bool:
-        """Check if a cached item already exists at the same location
+        """Check if a cached item already exists at the same location.
+        If the options contain input fingerprints, the item must have been cached with the same fingerprints
 
         :param cache_options: Options to locate the cached object
         :type cache_options: CacheOptions
@@ -125,10 +176,15 @@ class CacheService:
         :rtype: bool
         """
         cache_folder = self._get_cache_folder_path(cache_options)
+        if self._get_item_from_memory(cache_folder, cache_options, count_lookup=False) is not None:
+            return True
+
+        result = (
+            self._data_service.check_array_object(cache_folder, cache_options.get_item_key()) or
+            self._data_service.check_python_object(cache_folder, cache_options.get_item_key()))
 
-        result = self._data_service.check_python_object(
-            cache_folder,
-            cache_options.get_item_key())
+        if result and cache_options.input_fingerprints is not None:
+            result = self._fingerprints_match(cache_folder, cache_options)
 
         return result
 
@@ -152,6 +208,7 @@ class CacheService:
             return True
 
         cache_folder = self._get_cache_folder_path(cache_options)
+        self._remove_item_from_memory(cache_folder, cache_options)
 
         try:
             download_file_path = os.path.join(cache_folder, cache_options.get_item_key())
@@ -170,6 +227,113 @@ class CacheService:
             f'Object was downloaded and saved successfully')
         return True
 
+    @property
+    def memory_cache_hits(self) -> int:
+        return self._memory_cache_hits
+
+    @property
+    def memory_cache_misses(self) -> int:
+        return self._memory_cache_misses
+
+    @property
+    def memory_cache_size(self) -> int:
+        return self._memory_cache_size
+
+    def _get_item_from_memory(
+            self,
+            cache_folder: str,
+            cache_options: CacheOptions,
+            count_lookup: bool = True) -> Any:
+        cache_path = os.path.join(cache_folder, cache_options.get_item_key())
+        if cache_path not in self._memory_cache.keys():
+            if count_lookup:
+                self._memory_cache_misses += 1
+
+            return None
+
+        item, _, input_fingerprints = self._memory_cache[cache_path]
+        if cache_options.input_fingerprints is not None and input_fingerprints != cache_options.input_fingerprints:
+            self._remove_item_from_memory(cache_folder, cache_options)
+            if count_lookup:
+                self._memory_cache_misses += 1
+
+            return None
+
+        self._memory_cache.move_to_end(cache_path)
+        if count_lookup:
+            self._memory_cache_hits += 1
+            self._log_service.log_debug(
+                f'Loaded item with key {cache_options.get_item_key()} from memory [hits: {self._memory_cache_hits} | misses: {self._memory_cache_misses}]')
+
+        return item
+
+    def _add_item_to_memory(
+            self,
+            item: object,
+            cache_folder: str,
+            cache_options: CacheOptions):
+        item_size = self._get_item_memory_size(item, cache_folder, cache_options)
+        if self._memory_cache_budget == 0 or item_size > self._memory_cache_budget:
+            return
+
+        self._remove_item_from_memory(cache_folder, cache_options)
+
+        cache_path = os.path.join(cache_folder, cache_options.get_item_key())
+        self._memory_cache[cache_path] = (item, item_size, cache_options.input_fingerprints)
+        self._memory_cache_size += item_size
+
+        while self._memory_cache_size > self._memory_cache_budget:
+            _, (_, evicted_size, _) = self._memory_cache.popitem(last=False)
+            self._memory_cache_size -= evicted_size
+
+    def _get_item_memory_size(
+            self,
+            item: object,
+            cache_folder: str,
+            cache_options: CacheOptions) -> int:
+        # memory-mapped arrays are paged in and out by the system, so only the arrays and metadata held in memory are counted
+        if isinstance(item, ArrayCacheItem):
+            arrays_size = sum([
+                array.nbytes
+                for array in item.get_cache_arrays().values()
+                if not isinstance(array, np.memmap)
+            ])
+
+            return arrays_size + len(json.dumps(item.get_cache_metadata()))
+
+        # the size of the pickle is used as an estimate of the size of other items
+        return self._data_service.get_object_size(cache_folder, cache_options.get_item_key())
+
+    def _remove_item_from_memory(self, cache_folder: str, cache_options: CacheOptions):
+        cache_path = os.path.join(cache_folder, cache_options.get_item_key())
+        if cache_path in self._memory_cache.keys():
+            _, item_size, _ = self._memory_cache.pop(cache_path)
+            self._memory_cache_size -= item_size
+
+    def _fingerprints_match(self, cache_folder: str, cache_options: CacheOptions) -> bool:
+        fingerprints_path = self._get_fingerprints_path(cache_folder, cache_options)
+
+        cached_fingerprints = {}
+        if os.path.exists(fingerprints_path):
+            with open(fingerprints_path, 'r', encoding='utf-8') as fingerprints_file:
+                cached_fingerprints = json.load(fingerprints_file)
+
+        changed_inputs = [
+            input_name
+            for input_name, fingerprint in cache_options.input_fingerprints.items()
+            if input_name not in cached_fingerprints.keys() or cached_fingerprints[input_name] != fingerprint
+        ]
+
+        if len(changed_inputs) > 0:
+            self._log_service.log_info(
+                f'Cached item with key {cache_options.get_item_key()} is outdated [changed inputs: {", ".join(changed_inputs)}]')
+            return False
+
+        return True
+
+    def _get_fingerprints_path(self, cache_folder: str, cache_options: CacheOptions) -> str:
+        return os.path.join(cache_folder, f'{cache_options.get_item_key()}.fingerprints.json')
+
     def _get_cache_folder_path(self, cache_options: CacheOptions):
         if not cache_options.challenge_specific:
             return self._global_cache_folder
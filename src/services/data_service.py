@@ -2,14 +2,19 @@ from matplotlib.figure import Figure
 from services.log_service import LogService
 import _pickle as pickle
 import os
+import json
+import importlib
 from collections import defaultdict
 from datetime import datetime
 import time
 import logging
 from typing import List, Callable
 
+import numpy as np
 import matplotlib.pyplot as plt
 
+from entities.cache.array_cache_item import ArrayCacheItem
+
 class DataService:
 
     def __init__(
@@ -106,6 +111,112 @@ class DataService:
         result = os.path.exists(filepath)
         return result
 
+    def save_array_obj(self, obj: ArrayCacheItem, path: str, name: str) -> bool:
+        """Saves an array cache item to the file system as `.npy` files and a JSON manifest
+
+        :param obj: the object to be saved
+        :type obj: ArrayCacheItem
+        :param path: path to the folder where the item folder will be created
+        :type path: str
+        :param name: name of the item folder to be created
+        :type name: str
+        :return: whether the save was successfull
+        :rtype: bool
+        """
+        self._log_service.log_debug(f'Saving array object [path: \'{path}\' | name: \'{name}\']')
+
+        try:
+            folder_path = os.path.join(path, f'{name}.arrays')
+            os.makedirs(folder_path, exist_ok=True)
+
+            # the manifest is written last, so a partially saved item is never seen as existing
+            manifest_path = os.path.join(folder_path, 'manifest.json')
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+
+            arrays = obj.get_cache_arrays()
+            for array_name, array in arrays.items():
+                np.save(os.path.join(folder_path, f'{array_name}.npy'), array, allow_pickle=False)
+
+            manifest = {
+                'type': f'{type(obj).__module__}.{type(obj).__qualname__}',
+                'arrays': list(arrays.keys()),
+                'metadata': obj.get_cache_metadata()
+            }
+
+            temp_manifest_path = f'{manifest_path}.tmp'
+            with open(temp_manifest_path, 'w', encoding='utf-8') as manifest_file:
+                json.dump(manifest, manifest_file)
+
+            os.replace(temp_manifest_path, manifest_path)
+            self._log_service.log_debug(f'Saved successfully {name}')
+            return True
+        except Exception as e:
+            self._log_service.log_exception(f'Failed saving {name}, continue anyway', e)
+            return False
+
+    def get_object_size(self, path: str, name: str) -> int:
+        """Gets the size on disk of a saved array object or python object pickle
+
+        :param path: path to the folder where the object is located
+        :type path: str
+        :param name: name of the object
+        :type name: str
+        :return: the size in bytes, 0 if the object does not exist
+        :rtype: int
+        """
+        folder_path = os.path.join(path, f'{name}.arrays')
+        if os.path.isdir(folder_path):
+            return sum([entry.stat().st_size for entry in os.scandir(folder_path) if entry.is_file()])
+
+        filepath = os.path.join(path, f'{name}.pickle')
+        if os.path.exists(filepath):
+            return os.stat(filepath).st_size
+
+        return 0
+
+    def check_array_object(self, path: str, name: str) -> bool:
+        filepath = os.path.join(path, f'{name}.arrays', 'manifest.json')
+        result = os.path.exists(filepath)
+        self._log_service.log_debug(f'Checking array object {name}. Result - {result} [path: \'{filepath}\']')
+
+        return result
+
+    def load_array_obj(self, path: str, name: str) -> ArrayCacheItem:
+        """Loads an array cache item from disk, memory-mapping its arrays
+
+        :param path: path to the folder where the item folder is located
+        :type path: str
+        :param name: name of the item folder
+        :type name: str
+        :return: the loaded item
+        :rtype: ArrayCacheItem
+        """
+        self._log_service.log_debug(f'Loading array object [path: \'{path}\' | name: \'{name}\']')
+
+        folder_path = os.path.join(path, f'{name}.arrays')
+        try:
+            with open(os.path.join(folder_path, 'manifest.json'), 'r', encoding='utf-8') as manifest_file:
+                manifest = json.load(manifest_file)
+        except FileNotFoundError:
+            self._log_service.log_warning(f'{name} not loaded because file is missing')
+            return None
+
+        module_name, _, type_name = manifest['type'].rpartition('.')
+        item_type = getattr(importlib.import_module(module_name), type_name)
+        if not issubclass(item_type, ArrayCacheItem):
+            raise Exception(f'Cached item type {manifest["type"]} is not an array cache item')
+
+        arrays = {
+            array_name: np.load(os.path.join(folder_path, f'{array_name}.npy'), mmap_mode='r', allow_pickle=False)
+            for array_name in manifest['arrays']
+        }
+
+        obj = item_type.from_cache(arrays, manifest['metadata'])
+
+        self._log_service.log_debug(f'Loaded array object {name}. [path: \'{folder_path}\']')
+        return obj
+
     def personal_deepcopy(self, obj: object) -> object:
         """Deep copies any object faster than builtin
 
@@ -6,6 +6,9 @@ from typing import Tuple
 import torch
 from torch.utils.data import DataLoader
 
+from datasets.device_data_loader import DeviceDataLoader
+from datasets.length_bucket_batch_sampler import LengthBucketBatchSampler
+
 from enums.run_type import RunType
 
 from services.arguments.arguments_service_base import ArgumentsServiceBase
@@ -45,6 +48,19 @@ class DataLoaderService:
 
         return (data_loader_train, data_loader_validation)
 
+    def get_validation_dataloader(self) -> DataLoader:
+        """Loads and returns the validation dataloader
+
+        :return: the validation dataloader
+        :rtype: DataLoader
+        """
+        data_loader_validation = self._initialize_dataloader(
+            run_type=RunType.Validation,
+            batch_size=self._arguments_service.batch_size,
+            shuffle=False)
+
+        return data_loader_validation
+
     def get_test_dataloader(self) -> DataLoader:
         """Loads and returns the test dataloader
 
@@ -67,14 +83,62 @@ class DataLoaderService:
         self._log_service.log_debug(
             f'Initializing dataset for run type \'{run_type.value}\'')
         dataset = self._dataset_service.initialize_dataset(run_type)
-        data_loader: DataLoader = DataLoader(
-            dataset,
-            batch_size=batch_size,
-            shuffle=shuffle)
 
+        # only shuffled data is bucketed, as the order of the other sets is used when saving results
+        batch_sampler = None
+        if shuffle and self._arguments_service.bucket_by_length:
+            batch_sampler = self._create_length_bucket_batch_sampler(dataset, batch_size)
+
+        data_loader_arguments = self._get_data_loader_arguments()
         if dataset.use_collate_function():
-            data_loader.collate_fn = dataset.collate_function
+            data_loader_arguments['collate_fn'] = dataset.collate_function
+
+        if batch_sampler is not None:
+            data_loader: DataLoader = DeviceDataLoader(
+                dataset,
+                batch_sampler=batch_sampler,
+                **data_loader_arguments)
+        else:
+            data_loader: DataLoader = DeviceDataLoader(
+                dataset,
+                batch_size=batch_size,
+                shuffle=shuffle,
+                **data_loader_arguments)
 
         self._log_service.log_debug(
-            f'Created dataloader for run type \'{run_type.value}\' [shuffle: {shuffle} | batch size: {batch_size} | collate function: {dataset.use_collate_function()}]')
+            f'Created dataloader for run type \'{run_type.value}\' [shuffle: {shuffle} | batch size: {batch_size} | bucket by length: {batch_sampler is not None} | collate function: {dataset.use_collate_function()} | workers: {data_loader.num_workers} | pin memory: {data_loader.pin_memory}]')
         return data_loader
+
+    def _get_data_loader_arguments(self) -> dict:
+        # batches are padded on the CPU, possibly in worker processes, and moved to the device by the data loader
+        data_loader_arguments = {
+            'device': self._arguments_service.device,
+            'num_workers': self._arguments_service.dataloader_workers,
+            'pin_memory': self._arguments_service.pin_memory and torch.cuda.is_available()
+        }
+
+        # these can only be set when worker processes are used
+        if self._arguments_service.dataloader_workers > 0:
+            data_loader_arguments['persistent_workers'] = self._arguments_service.persistent_workers
+            if self._arguments_service.prefetch_factor is not None:
+                data_loader_arguments['prefetch_factor'] = self._arguments_service.prefetch_factor
+
+        return data_loader_arguments
+
+    def _create_length_bucket_batch_sampler(
+            self,
+            dataset,
+            batch_size: int) -> LengthBucketBatchSampler:
+        item_lengths = dataset.get_item_lengths()
+        if item_lengths is None:
+            self._log_service.log_warning(
+                'Bucketing by length is not supported by the dataset, using random batches instead')
+            return None
+
+        batch_sampler = LengthBucketBatchSampler(
+            item_lengths,
+            batch_size,
+            self._log_service,
+            max_batch_tokens=self._arguments_service.max_batch_tokens)
+
+        return batch_sampler
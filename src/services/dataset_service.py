@@ -14,6 +14,7 @@ from services.vocabulary_service import VocabularyService
 from services.metrics_service import MetricsService
 from services.data_service import DataService
 from services.process.process_service_base import ProcessServiceBase
+from services.pretrained_features_service import PretrainedFeaturesService
 
 
 class DatasetService:
@@ -23,12 +24,14 @@ class DatasetService:
             mask_service: MaskService,
             process_service: ProcessServiceBase,
             vocabulary_service: VocabularyService,
+            pretrained_features_service: PretrainedFeaturesService,
             log_service: LogService):
 
         self._arguments_service = arguments_service
         self._mask_service = mask_service
         self._process_service = process_service
         self._vocabulary_service = vocabulary_service
+        self._pretrained_features_service = pretrained_features_service
         self._log_service = log_service
 
     def initialize_dataset(self, run_type: RunType) -> DatasetBase:
@@ -53,6 +56,7 @@ class DatasetService:
                     arguments_service=self._arguments_service,
                     vocabulary_service=self._vocabulary_service,
                     process_service=self._process_service,
+                    pretrained_features_service=self._pretrained_features_service,
                     log_service=self._log_service,
                     run_type=run_type)
 
@@ -46,8 +46,9 @@ class NEREvaluationService(BaseEvaluationService):
 
         result = []
         for entity_tag_type, type_predictions in predictions.items():
-            for i, prediction in enumerate(type_predictions.squeeze(0).cpu().detach().tolist()):
-                predicted_entity = self._process_service.get_entity_by_label(prediction, entity_tag_type, ignore_unknown=True)
+            predicted_entities = self._process_service.labels_to_tags(
+                type_predictions.squeeze(0), entity_tag_type, ignore_unknown=True).tolist()
+            for i, predicted_entity in enumerate(predicted_entities):
                 if len(result) <= i:
                     result.append({})
 
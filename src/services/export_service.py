@@ -0,0 +1,144 @@
+import os
+import json
+import torch
+
+from typing import List, Tuple
+
+from models.model_base import ModelBase
+
+from services.arguments.ner_arguments_service import NERArgumentsService
+from services.dataloader_service import DataLoaderService
+from services.file_service import FileService
+from services.log_service import LogService
+from services.process.ner_process_service import NERProcessService
+
+
+class ExportService:
+    def __init__(
+            self,
+            arguments_service: NERArgumentsService,
+            dataloader_service: DataLoaderService,
+            file_service: FileService,
+            log_service: LogService,
+            process_service: NERProcessService,
+            model: ModelBase,
+            example_batches_count: int = 3):
+
+        self._arguments_service = arguments_service
+        self._dataloader_service = dataloader_service
+        self._file_service = file_service
+        self._log_service = log_service
+        self._process_service = process_service
+        self._example_batches_count = example_batches_count
+
+        self._model = model.to(arguments_service.device)
+
+    def export(self) -> str:
+        """Export the best checkpoint of the model as a single TorchScript file, which can be loaded
+        with `torch.jit.load` without constructing the model. The graph is traced on batches of the validation set
+        and the label of every entity tag type, along with the expected inputs, is embedded as extra files
+
+        :return: The path of the exported model
+        :rtype: str
+        """
+        self._validate_configuration()
+
+        checkpoints_path = self._file_service.get_checkpoints_path()
+        self._model.load(checkpoints_path, 'BEST')
+        self._model.eval()
+
+        quantize_pretrained_model = self._arguments_service.quantize_pretrained_model
+        quantize_rnn_encoder = self._arguments_service.quantize_rnn_encoder
+        if quantize_pretrained_model or quantize_rnn_encoder:
+            self._model.quantize(quantize_pretrained_model, quantize_rnn_encoder)
+
+        inference_module = self._model.create_inference_module()
+        if inference_module is None:
+            raise Exception('Exporting is not supported for this model')
+
+        example_inputs = self._get_example_inputs()
+        with torch.no_grad():
+            # the other batches are used to check that the traced graph does not depend on the first one
+            exported_module = torch.jit.trace(
+                inference_module,
+                example_inputs[0],
+                check_inputs=example_inputs[1:] if len(example_inputs) > 1 else None)
+
+        export_path = os.path.join(
+            checkpoints_path,
+            f'{self._arguments_service.get_configuration_name()}-inference.pt')
+
+        torch.jit.save(
+            exported_module,
+            export_path,
+            _extra_files={
+                'labels.json': json.dumps(self._get_labels()),
+                'config.json': json.dumps(self._get_export_config())
+            })
+
+        self._log_service.log_info(f'Exported model to "{export_path}"')
+        return export_path
+
+    def _validate_configuration(self):
+        if self._arguments_service.merge_subwords:
+            raise Exception('Exporting is not supported when merging subword embeddings')
+
+        if self._arguments_service.include_fasttext_model:
+            raise Exception('Exporting is not supported when including a fast text model')
+
+        if self._arguments_service.unpad_pretrained_inputs:
+            raise Exception('Exporting is not supported when unpadding the pre-trained model inputs')
+
+        if (self._arguments_service.quantize_pretrained_model or self._arguments_service.quantize_rnn_encoder) and self._arguments_service.device != 'cpu':
+            raise Exception('Quantization is only supported on CPU')
+
+    def _get_example_inputs(self) -> List[Tuple[torch.Tensor, ...]]:
+        example_inputs = []
+        for batch in self._dataloader_service.get_validation_dataloader():
+            example_inputs.append((
+                batch.subword_sequences,
+                batch.subword_lengths,
+                batch.character_sequences,
+                batch.subword_characters_count,
+                batch.manual_features))
+
+            if len(example_inputs) == self._example_batches_count:
+                break
+
+        if len(example_inputs) == 0:
+            raise Exception('No validation batches found to trace the model with')
+
+        return example_inputs
+
+    def _get_labels(self) -> dict:
+        labels = {}
+        for entity_tag_type in self._process_service.get_labels_amount().keys():
+            entities, known_labels = self._process_service.get_entities_by_label(entity_tag_type)
+            labels[entity_tag_type.value] = [
+                entity if known_label else None
+                for entity, known_label in zip(entities, known_labels)
+            ]
+
+        return labels
+
+    def _get_export_config(self) -> dict:
+        config = {
+            'entity_tag_types': [
+                entity_tag_type.value
+                for entity_tag_type in self._process_service.get_labels_amount().keys()
+            ],
+            'inputs': [
+                'subword_sequences',
+                'subword_lengths',
+                'character_sequences',
+                'subword_characters_count',
+                'manual_features'
+            ],
+            'use_character_sequences': self._arguments_service.learn_character_embeddings,
+            'use_manual_features': self._arguments_service.use_manual_features,
+            'pad_idx': self._process_service.pad_idx,
+            'start_idx': self._process_service.start_idx,
+            'stop_idx': self._process_service.stop_idx
+        }
+
+        return config
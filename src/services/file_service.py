@@ -1,4 +1,9 @@
 import os
+import json
+import hashlib
+import inspect
+
+from typing import Dict, List
 
 from enums.language import Language
 
@@ -12,6 +17,9 @@ class FileService:
 
         self._arguments_service = arguments_service
 
+        # hashes of files are remembered between runs, keyed by the path, and reused while the size and modification time stay the same
+        self._file_fingerprints: Dict[str, dict] = None
+
     def get_initial_data_path(self) -> str:
         data_path = self._arguments_service.data_folder
         return data_path
@@ -157,4 +165,83 @@ class FileService:
                 else:
                     raise Exception(f'Path "{final_path}" does not exist')
 
-        return final_path
\ No newline at end of file
+        return final_path
+
+    def get_file_fingerprint(self, file_path: str) -> str:
+        """Get a fingerprint of the contents of a file, which changes whenever the file is edited.
+        The contents are hashed only once for every size and modification time of the file, also across runs
+
+        :param file_path: The path of the file
+        :type file_path: str
+        :return: Hash of the file contents or `None` if the file does not exist
+        :rtype: str
+        """
+        if not os.path.exists(file_path):
+            return None
+
+        file_stat = os.stat(file_path)
+        file_fingerprints = self._get_file_fingerprints()
+        fingerprint_key = os.path.abspath(file_path)
+        stored_fingerprint = file_fingerprints.get(fingerprint_key, None)
+        if (stored_fingerprint is not None and
+                stored_fingerprint['size'] == file_stat.st_size and
+                stored_fingerprint['mtime_ns'] == file_stat.st_mtime_ns):
+            return stored_fingerprint['fingerprint']
+
+        file_hash = hashlib.sha1()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                file_hash.update(chunk)
+
+        file_fingerprints[fingerprint_key] = {
+            'size': file_stat.st_size,
+            'mtime_ns': file_stat.st_mtime_ns,
+            'fingerprint': file_hash.hexdigest()
+        }
+
+        self._save_file_fingerprints()
+        return file_hash.hexdigest()
+
+    def get_source_fingerprint(self, objects: List[object]) -> str:
+        """Get a fingerprint of the source code of the modules which define the provided classes or functions
+
+        :param objects: The classes or functions whose code is used
+        :type objects: List[object]
+        :return: Hash of the source files
+        :rtype: str
+        """
+        source_hash = hashlib.sha1()
+        for source_file in sorted(set([inspect.getsourcefile(x) for x in objects])):
+            source_hash.update(os.path.basename(source_file).encode('utf-8'))
+            source_hash.update(self.get_file_fingerprint(source_file).encode('utf-8'))
+
+        return source_hash.hexdigest()
+
+    def _get_file_fingerprints(self) -> Dict[str, dict]:
+        if self._file_fingerprints is None:
+            self._file_fingerprints = {}
+            fingerprints_path = self._get_file_fingerprints_path()
+            if os.path.exists(fingerprints_path):
+                try:
+                    with open(fingerprints_path, 'r', encoding='utf-8') as fingerprints_file:
+                        self._file_fingerprints = json.load(fingerprints_file)
+                except ValueError:
+                    # a damaged file only means that the files are hashed again
+                    self._file_fingerprints = {}
+
+        return self._file_fingerprints
+
+    def _save_file_fingerprints(self):
+        fingerprints_path = self._get_file_fingerprints_path()
+        temporary_path = f'{fingerprints_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as fingerprints_file:
+            json.dump(self._file_fingerprints, fingerprints_file)
+
+        os.replace(temporary_path, fingerprints_path)
+
+    def _get_file_fingerprints_path(self) -> str:
+        cache_folder = self.combine_path(
+            self._arguments_service.cache_folder,
+            create_if_missing=True)
+
+        return os.path.join(cache_folder, 'file-fingerprints.json')
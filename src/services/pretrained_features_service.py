@@ -0,0 +1,202 @@
+import os
+import hashlib
+import tempfile
+
+import numpy as np
+import torch
+
+from typing import List
+from transformers.utils import cached_file
+
+from entities.cache.cache_options import CacheOptions
+from entities.options.pretrained_representations_options import PretrainedRepresentationsOptions
+from entities.pretrained_features import PretrainedFeatures
+
+from enums.run_type import RunType
+
+from models.pretrained.pretrained_representations_layer import PretrainedRepresentationsLayer
+
+from services.arguments.pretrained_arguments_service import PretrainedArgumentsService
+from services.cache_service import CacheService
+from services.data_service import DataService
+from services.file_service import FileService
+from services.log_service import LogService
+
+
+class PretrainedFeaturesService:
+    def __init__(
+            self,
+            arguments_service: PretrainedArgumentsService,
+            cache_service: CacheService,
+            data_service: DataService,
+            file_service: FileService,
+            log_service: LogService):
+        self._arguments_service = arguments_service
+        self._cache_service = cache_service
+        self._data_service = data_service
+        self._file_service = file_service
+        self._log_service = log_service
+
+    def use_pretrained_features(self) -> bool:
+        """Whether the representations of the pre-trained model should be precomputed.
+        This is only possible while the pre-trained model is frozen
+
+        :return: Whether the representations should be precomputed
+        :rtype: bool
+        """
+        return (
+            self._arguments_service.precompute_pretrained_features and
+            self._arguments_service.include_pretrained_model and
+            not self._arguments_service.fine_tune_pretrained)
+
+    def get_pretrained_features(
+            self,
+            run_type: RunType,
+            token_ids: np.ndarray,
+            token_ids_offsets: np.ndarray) -> PretrainedFeatures:
+        """Get the representations of the pre-trained model for every subword of a dataset.
+        They are computed once and cached, and rebuilt only when the subwords or the pre-trained model change
+
+        :param run_type: The run type of the dataset
+        :type run_type: RunType
+        :param token_ids: The subword ids of all lines, concatenated
+        :type token_ids: np.ndarray
+        :param token_ids_offsets: The offsets of every line in the subword ids
+        :type token_ids_offsets: np.ndarray
+        :return: The representations of every subword
+        :rtype: PretrainedFeatures
+        """
+        token_ids_hash = hashlib.sha1()
+        token_ids_hash.update(np.ascontiguousarray(token_ids, dtype=np.int64).tobytes())
+        token_ids_hash.update(np.ascontiguousarray(token_ids_offsets, dtype=np.int64).tobytes())
+
+        pretrained_weights = self._arguments_service.pretrained_weights
+        cache_options = CacheOptions(
+            item_key=f'pretrained-features-{pretrained_weights.replace("/", "-")}-{run_type.value}',
+            configuration_specific=False,
+            input_fingerprints={
+                'data': token_ids_hash.hexdigest(),
+                'model': self._get_model_fingerprint()
+            })
+
+        # the features are written to a temporary file, which is copied to the cache and not used afterwards
+        cache_folder = self._file_service.combine_path(
+            self._arguments_service.cache_folder,
+            create_if_missing=True)
+
+        features_file, features_path = tempfile.mkstemp(prefix='pretrained-features-', suffix='.npy', dir=cache_folder)
+        os.close(features_file)
+
+        result = None
+        try:
+            result = self._cache_service.get_item_from_cache(
+                cache_options,
+                callback_function=lambda: self._compute_pretrained_features(token_ids, token_ids_offsets, features_path))
+        finally:
+            # the file is kept only if the features could not be cached and are still read from it
+            if result is None or self._cache_service.item_exists(cache_options):
+                os.remove(features_path)
+
+        return result
+
+    def _get_model_fingerprint(self) -> str:
+        """Get a fingerprint of the files of the pre-trained model, resolved the same way as when loading it,
+        whether the weights are a local folder or a downloaded model
+
+        :return: Hash of the configuration and weights of the model
+        :rtype: str
+        """
+        model_hash = hashlib.sha1()
+        model_hash.update(f'{self._arguments_service.pretrained_weights}-{self._arguments_service.pretrained_max_length}'.encode('utf-8'))
+        for model_file_path in self._get_model_file_paths():
+            model_hash.update(os.path.basename(model_file_path).encode('utf-8'))
+            model_hash.update(self._file_service.get_file_fingerprint(model_file_path).encode('utf-8'))
+
+        return model_hash.hexdigest()
+
+    def _get_model_file_paths(self) -> List[str]:
+        model_file_paths = []
+        for file_names in [['config.json'], ['model.safetensors', 'model.safetensors.index.json', 'pytorch_model.bin']]:
+            # only the first weights file that is found is used, as when loading the model
+            for file_name in file_names:
+                try:
+                    model_file_path = cached_file(
+                        self._arguments_service.pretrained_weights,
+                        file_name,
+                        _raise_exceptions_for_missing_entries=False)
+                except Exception:
+                    model_file_path = None
+
+                if model_file_path is not None:
+                    model_file_paths.append(model_file_path)
+                    break
+
+            # without a configuration the weights can not be resolved either
+            if len(model_file_paths) == 0:
+                break
+
+        return model_file_paths
+
+    def _compute_pretrained_features(
+            self,
+            token_ids: np.ndarray,
+            token_ids_offsets: np.ndarray,
+            features_path: str) -> PretrainedFeatures:
+        pretrained_layer = self._create_pretrained_layer()
+        device = self._arguments_service.device
+        batch_size = self._arguments_service.batch_size
+
+        lengths = np.diff(token_ids_offsets)
+        features = np.lib.format.open_memmap(
+            features_path,
+            mode='w+',
+            dtype=np.float32,
+            shape=(len(token_ids), self._arguments_service.pretrained_model_size))
+
+        # lines of the same length are run together, so that no padding changes their representations
+        self._log_service.log_info(f'Computing pre-trained representations for {len(lengths)} lines')
+        line_indices = np.argsort(lengths, kind='stable')
+        with torch.no_grad():
+            for length in np.unique(lengths[line_indices]):
+                if length == 0:
+                    continue
+
+                same_length_indices = line_indices[lengths[line_indices] == length]
+                for batch_start in range(0, len(same_length_indices), batch_size):
+                    batch_indices = same_length_indices[batch_start:batch_start + batch_size]
+                    positions = token_ids_offsets[batch_indices][:, None] + np.arange(length)
+
+                    input_tensor = torch.from_numpy(token_ids[positions].astype(np.int64)).to(device)
+                    representations = pretrained_layer.get_pretrained_representation(input_tensor)
+                    features[positions.reshape(-1)] = representations.reshape(-1, features.shape[-1]).cpu().numpy()
+
+        features.flush()
+
+        # the pre-trained model is only needed once, so it does not stay on the device next to the one being trained
+        del pretrained_layer
+        if device.startswith('cuda'):
+            torch.cuda.empty_cache()
+
+        return PretrainedFeatures(features, np.asarray(token_ids_offsets, dtype=np.int64))
+
+    def _create_pretrained_layer(self) -> PretrainedRepresentationsLayer:
+        pretrained_options = PretrainedRepresentationsOptions(
+            include_pretrained_model=self._arguments_service.include_pretrained_model,
+            pretrained_model_size=self._arguments_service.pretrained_model_size,
+            pretrained_weights=self._arguments_service.pretrained_weights,
+            pretrained_max_length=self._arguments_service.pretrained_max_length,
+            pretrained_model=self._arguments_service.pretrained_model,
+            fine_tune_pretrained=False,
+            fine_tune_after_convergence=False)
+
+        pretrained_layer = PretrainedRepresentationsLayer(
+            data_service=self._data_service,
+            arguments_service=self._arguments_service,
+            log_service=self._log_service,
+            file_service=self._file_service,
+            device=self._arguments_service.device,
+            pretrained_representations_options=pretrained_options)
+
+        pretrained_layer.to(self._arguments_service.device)
+        pretrained_layer.eval()
+        return pretrained_layer
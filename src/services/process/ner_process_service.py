@@ -2,6 +2,7 @@ from enums.run_type import RunType
 from entities.ner.ne_line import NELine
 from enums.language import Language
 from entities.ner.ne_collection import NECollection
+from entities.ner.columnar_ne_collection import ColumnarNECollection
 import os
 import csv
 from services.data_service import DataService
@@ -11,6 +12,10 @@ from enums.entity_tag_type import EntityTagType
 from entities.cache.cache_options import CacheOptions
 from typing import Dict, List, Tuple
 import random
+import numpy as np
+import torch
+from functools import partial
+from multiprocessing import Pool
 
 from enums.ocr_output_type import OCROutputType
 
@@ -57,42 +62,86 @@ class NERProcessService(ProcessServiceBase):
         train_cache_key = f'train-data-limit-{arguments_service.train_dataset_limit_size}-merge-{arguments_service.merge_subwords}-replacen-{arguments_service.replace_all_numbers}'
         validation_cache_key = f'validation-data-limit-{arguments_service.validation_dataset_limit_size}-merge-{arguments_service.merge_subwords}-replacen-{arguments_service.replace_all_numbers}'
         test_cache_key = f'test-data-merge-{arguments_service.merge_subwords}-replacen-{arguments_service.replace_all_numbers}'
+
+        # columnar collections are stored under a different key as they are saved as arrays instead of pickled
+        collection_key_suffixes = None
+        if arguments_service.columnar_ne_collection:
+            collection_key_suffixes = ['-columnar']
+
+        # cached data is rebuilt when the data files, the tokenizer vocabulary or the preprocessing code change
+        train_file_path = os.path.join(challenge_path, f'data-train-{language_suffix}.tsv')
+        validation_file_path = os.path.join(challenge_path, f'data-dev-{language_suffix}.tsv')
+        test_file_path = os.path.join(challenge_path, f'data-test-{language_suffix}.tsv')
+
+        preprocessing_fingerprints = {
+            'tokenizer': tokenize_service.get_fingerprint(),
+            'code': file_service.get_source_fingerprint([
+                NERProcessService,
+                NELine,
+                NECollection,
+                ColumnarNECollection,
+                StringProcessService])
+        }
+
+        train_data_fingerprint = file_service.get_file_fingerprint(train_file_path)
+        validation_data_fingerprint = file_service.get_file_fingerprint(validation_file_path)
+
         self._train_ne_collection = cache_service.get_item_from_cache(
             CacheOptions(
                 item_key=train_cache_key,
-                configuration_specific=False),
+                configuration_specific=False,
+                key_suffixes=collection_key_suffixes,
+                input_fingerprints={
+                    'data': train_data_fingerprint,
+                    **preprocessing_fingerprints
+                }),
             callback_function=lambda: (
                 self.preprocess_data(
-                    os.path.join(
-                        challenge_path, f'data-train-{language_suffix}.tsv'),
+                    train_file_path,
                     limit=arguments_service.train_dataset_limit_size)))
 
         self._validation_ne_collection = cache_service.get_item_from_cache(
             CacheOptions(
                 item_key=validation_cache_key,
-                configuration_specific=False),
+                configuration_specific=False,
+                key_suffixes=collection_key_suffixes,
+                input_fingerprints={
+                    'data': validation_data_fingerprint,
+                    **preprocessing_fingerprints
+                }),
             callback_function=lambda: (
                 self.preprocess_data(
-                    os.path.join(
-                        challenge_path, f'data-dev-{language_suffix}.tsv'),
+                    validation_file_path,
                     limit=arguments_service.validation_dataset_limit_size)))
 
         self._test_ne_collection = cache_service.get_item_from_cache(
             CacheOptions(
                 item_key=test_cache_key,
-                configuration_specific=False),
+                configuration_specific=False,
+                key_suffixes=collection_key_suffixes,
+                input_fingerprints={
+                    'data': file_service.get_file_fingerprint(test_file_path),
+                    **preprocessing_fingerprints
+                }),
             callback_function=lambda: (
-                self.preprocess_data(
-                    os.path.join(
-                        challenge_path, f'data-test-{language_suffix}.tsv'))))
+                self.preprocess_data(test_file_path)))
 
         self._entity_mappings = self._create_entity_mappings(
             self._train_ne_collection,
             self._validation_ne_collection)
 
+        self._entities_by_label = self._create_reversed_entity_mappings(
+            self._entity_mappings)
+
         vocabulary_cache_key = f'char-vocabulary'
         vocabulary_data = cache_service.get_item_from_cache(
-            CacheOptions(item_key=vocabulary_cache_key),
+            CacheOptions(
+                item_key=vocabulary_cache_key,
+                input_fingerprints={
+                    'train-data': train_data_fingerprint,
+                    'validation-data': validation_data_fingerprint,
+                    **preprocessing_fingerprints
+                }),
             callback_function=lambda: self._generate_vocabulary_data(language_suffix))
 
         vocabulary_service.initialize_vocabulary_data(vocabulary_data)
@@ -104,6 +153,24 @@ class NERProcessService(ProcessServiceBase):
         if not os.path.exists(file_path):
             raise Exception(f'NER File not found at "{file_path}"')
 
+        if self._arguments_service.preprocessing_batch_size is not None:
+            collection = self._preprocess_documents_in_batches(
+                file_path,
+                limit=limit,
+                batch_size=self._arguments_service.preprocessing_batch_size,
+                workers=self._arguments_service.preprocessing_workers)
+        else:
+            collection = self._preprocess_documents(file_path, limit=limit)
+
+        if self._arguments_service.columnar_ne_collection:
+            collection = ColumnarNECollection(collection)
+
+        return collection
+
+    def _preprocess_documents(
+            self,
+            file_path: str,
+            limit: int = None) -> NECollection:
         collection = NECollection()
 
         with open(file_path, 'r', encoding='utf-8') as tsv_file:
@@ -158,6 +225,91 @@ class NERProcessService(ProcessServiceBase):
 
         return collection
 
+    def _preprocess_documents_in_batches(
+            self,
+            file_path: str,
+            limit: int,
+            batch_size: int,
+            workers: int) -> NECollection:
+        """
+        Split the file into documents first, then create the lines of every batch of documents,
+        using a process pool if more than one worker is requested, and tokenize them together.
+        The lines keep the order of the documents in the file, same as `_preprocess_documents`
+        """
+        documents = self._read_documents(file_path)
+        create_line = partial(
+            _create_ne_line,
+            string_process_service=self._string_process_service,
+            entity_tag_types=self._entity_tag_types)
+
+        collection = NECollection()
+        pool = Pool(processes=workers) if workers > 1 else None
+        try:
+            for batch_start in range(0, len(documents), batch_size):
+                documents_batch = documents[batch_start:batch_start + batch_size]
+                if pool is not None:
+                    lines = pool.map(create_line, documents_batch)
+                else:
+                    lines = [create_line(document) for document in documents_batch]
+
+                # documents without any tokens are skipped
+                lines = [line for line in lines if len(line.tokens) > 0]
+                if limit:
+                    lines = lines[:limit - len(collection)]
+
+                texts = [
+                    line.prepare_for_tokenization(
+                        self._string_process_service,
+                        replace_all_numbers=self._arguments_service.replace_all_numbers)
+                    for line in lines
+                ]
+
+                encoded_sequences = self._tokenize_service.encode_sequences(texts) if len(texts) > 0 else []
+                for line, encoded_sequence in zip(lines, encoded_sequences):
+                    line.update_tokens(
+                        encoded_sequence,
+                        expand_targets=not self._arguments_service.merge_subwords)
+
+                collection.add_lines(lines)
+
+                if limit and len(collection) >= limit:
+                    break
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        return collection
+
+    def _read_documents(self, file_path: str) -> List[Tuple[str, List[dict]]]:
+        """
+        Read the data rows of every document in the file, in the order of the file.
+        Rows before the first document header belong to a document without id
+        """
+        documents = []
+
+        with open(file_path, 'r', encoding='utf-8') as tsv_file:
+            reader = csv.DictReader(
+                tsv_file, dialect=csv.excel_tab, quoting=csv.QUOTE_NONE)
+            current_document = (None, [])
+
+            for row in reader:
+                if row['TOKEN'] == '':
+                    continue
+
+                if row['TOKEN'].startswith('# document'):
+                    documents.append(current_document)
+                    document_id = row['TOKEN'].split('=')[-1].strip()
+                    current_document = (document_id, [])
+                elif row['TOKEN'].startswith('#'):
+                    continue
+                else:
+                    current_document[1].append(row)
+
+            documents.append(current_document)
+
+        return documents
+
     def get_processed_data(self, run_type: RunType):
         if run_type == RunType.Train:
             return self._train_ne_collection
@@ -210,18 +362,71 @@ class NERProcessService(ProcessServiceBase):
         return self._entity_mappings[entity_tag_type][entity_tag]
 
     def get_entity_by_label(self, label: int, entity_tag_type: EntityTagType, ignore_unknown: bool = False) -> str:
-        if entity_tag_type not in self._entity_mappings.keys():
+        if entity_tag_type not in self._entities_by_label.keys():
             raise Exception('Invalid entity tag type')
 
-        for entity, entity_label in self._entity_mappings[entity_tag_type].items():
-            if label == entity_label:
-                return entity
+        entities, known_labels = self._entities_by_label[entity_tag_type]
+        if 0 <= label < len(entities) and known_labels[label]:
+            return entities[label]
 
         if ignore_unknown:
             return 'O'
 
         raise Exception('Entity not found for this label')
 
+    def get_entities_by_label(self, entity_tag_type: EntityTagType) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the entity tag of every label, along with whether the label has an entity tag
+
+        :param entity_tag_type: the entity tag type of the labels
+        :type entity_tag_type: EntityTagType
+        :return: object array with the entity tag of every label and a boolean array of the known labels
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        if entity_tag_type not in self._entities_by_label.keys():
+            raise Exception('Invalid entity tag type')
+
+        return self._entities_by_label[entity_tag_type]
+
+    def labels_to_tags(
+            self,
+            labels,
+            entity_tag_type: EntityTagType,
+            ignore_unknown: bool = False) -> np.ndarray:
+        """
+        Convert a whole tensor or array of labels to their entity tags at once
+
+        :param labels: the labels to convert, of any shape
+        :type labels: torch.Tensor or np.ndarray
+        :param entity_tag_type: the entity tag type the labels belong to
+        :type entity_tag_type: EntityTagType
+        :param ignore_unknown: if set, unknown labels are converted to 'O' instead of raising an exception
+        :type ignore_unknown: bool
+        :return: object array with the same shape as the labels, containing the entity tags
+        :rtype: np.ndarray
+        """
+        if entity_tag_type not in self._entities_by_label.keys():
+            raise Exception('Invalid entity tag type')
+
+        if isinstance(labels, torch.Tensor):
+            labels = labels.detach().cpu().numpy()
+
+        labels = np.asarray(labels, dtype=np.int64)
+        entities, known_labels = self._entities_by_label[entity_tag_type]
+
+        in_range = (labels >= 0) & (labels < len(entities))
+        safe_labels = np.where(in_range, labels, 0)
+        unknown = ~(in_range & known_labels[safe_labels])
+
+        result = entities[safe_labels]
+        if unknown.any():
+            if not ignore_unknown:
+                raise Exception('Entity not found for this label')
+
+            result[unknown] = 'O'
+
+        return result
+
     def _create_entity_mappings(
             self,
             train_ne_collection: NECollection,
@@ -247,6 +452,24 @@ class NERProcessService(ProcessServiceBase):
 
         return entity_mappings
 
+    def _create_reversed_entity_mappings(
+            self,
+            entity_mappings: Dict[EntityTagType, Dict[str, int]]) -> Dict[EntityTagType, Tuple[np.ndarray, np.ndarray]]:
+        entities_by_label = {}
+        for entity_tag_type, entity_mapping in entity_mappings.items():
+            labels_count = max(entity_mapping.values()) + 1
+            entities = np.empty(labels_count, dtype=object)
+            known_labels = np.zeros(labels_count, dtype=np.bool_)
+
+            # labels are unique, but if not, the first entity of a label wins, same as the mapping scan
+            for entity, label in reversed(list(entity_mapping.items())):
+                entities[label] = entity
+                known_labels[label] = True
+
+            entities_by_label[entity_tag_type] = (entities, known_labels)
+
+        return entities_by_label
+
     def _generate_vocabulary_data(self, language_suffix: str):
         unique_characters = set()
 
@@ -283,3 +506,18 @@ class NERProcessService(ProcessServiceBase):
             return 'nl'
         else:
             raise Exception('Unsupported language')
+
+
+def _create_ne_line(
+        document: Tuple[str, List[dict]],
+        string_process_service: StringProcessService,
+        entity_tag_types: List[EntityTagType]) -> NELine:
+    # defined on module level so that it can be sent to the worker processes
+    document_id, rows = document
+
+    ne_line = NELine()
+    ne_line.document_id = document_id
+    for row in rows:
+        ne_line.add_data(string_process_service, row, entity_tag_types)
+
+    return ne_line
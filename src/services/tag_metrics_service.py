@@ -1,12 +1,25 @@
 import numpy as np
 
-from copy import deepcopy
-from collections import defaultdict, namedtuple
+from bisect import bisect_left
+from collections import namedtuple
+from typing import Dict, List, Tuple
+
+from entities.ner.tag_metric_counts import TagMetricCounts
 
 from enums.tag_metric import TagMetric
 from enums.tag_measure_type import TagMeasureType
 
 Entity = namedtuple("Entity", "e_type start_offset end_offset")
+LabelLookup = namedtuple("LabelLookup", "known outside begin entity_type_ids entity_types")
+
+_strict = TagMetricCounts.measure_types.index(TagMeasureType.Strict)
+_partial = TagMetricCounts.measure_types.index(TagMeasureType.Partial)
+
+_correct = TagMetricCounts.count_metrics.index(TagMetric.Correct)
+_incorrect = TagMetricCounts.count_metrics.index(TagMetric.Incorrect)
+_partial_match = TagMetricCounts.count_metrics.index(TagMetric.Partial)
+_missed = TagMetricCounts.count_metrics.index(TagMetric.Missed)
+_spurious = TagMetricCounts.count_metrics.index(TagMetric.Spurious)
 
 
 class TagMetricsService:
@@ -14,45 +27,14 @@ class TagMetricsService:
     """
 
     def __init__(self):
-        self.metrics = {
-            TagMetric.Correct: 0,
-            TagMetric.Incorrect: 0,
-            TagMetric.Partial: 0,
-            TagMetric.Missed: 0,
-            TagMetric.Spurious: 0,
-            TagMetric.Possible: 0,
-            TagMetric.Actual: 0,
-            TagMetric.TruePositives: 0,
-            TagMetric.FalsePositives: 0,
-            TagMetric.FalsePositives: 0,
-            TagMetric.PrecisionMicro: 0,
-            TagMetric.RecallMicro: 0,
-            TagMetric.F1ScoreMicro: 0,
-            TagMetric.PrecisionMacroDoc: [],
-            TagMetric.RecallMacroDoc: [],
-            TagMetric.F1ScoreMacroDoc: [],
-            TagMetric.PrecisionMacro: 0,
-            TagMetric.RecallMacro: 0,
-            TagMetric.F1ScoreMacro: 0,
-        }
-
-        # four evaluation schemes
-        self.metric_schema = {
-            TagMeasureType.Strict: deepcopy(self.metrics),
-            TagMeasureType.Partial: deepcopy(self.metrics),
-        }
-
         self.reset()
 
     def reset(self):
-        self._results = {}
-        self._results_per_type = {}
+        self._results: Dict[str, TagMetricCounts] = {}
 
     def initialize(self, entity_tag_type):
         # Create an accumulator to store overall results
-        self._results[entity_tag_type] = deepcopy(self.metric_schema)
-        self._results_per_type[entity_tag_type] = defaultdict(
-            lambda: deepcopy(self.metric_schema))
+        self._results[entity_tag_type] = TagMetricCounts()
 
     def calculate_batch(
             self,
@@ -60,99 +42,88 @@ class TagMetricsService:
             target_tags,
             main_entities):
 
-        results = deepcopy(self.metric_schema)
-        results_per_type = defaultdict(lambda: deepcopy(self.metric_schema))
+        result = self.calculate_batch_from_entities(
+            [self._get_named_entities(x) for x in prediction_tags],
+            [self._get_named_entities(x) for x in target_tags],
+            main_entities)
 
-        results, results_per_type = self._aggregate_batch(
+        return result
+
+    def calculate_batch_from_entities(
+            self,
+            predicted_named_entities,
+            true_named_entities,
+            main_entities):
+
+        results = TagMetricCounts()
+
+        self._aggregate_batch(
             results,
-            results_per_type,
-            prediction_tags,
-            target_tags,
+            predicted_named_entities,
+            true_named_entities,
             main_entities)
 
-        result = self._calculate_overall_stats(results, results_per_type)
+        result = self._calculate_overall_stats(results)
         return result
 
     def _aggregate_batch(
             self,
-            results,
-            results_per_type,
-            prediction_tags,
-            target_tags,
+            results: TagMetricCounts,
+            batch_predicted_named_entities,
+            batch_true_named_entities,
             main_entities,
             calculate_doc_scores: bool = False):
-        for (current_prediction_tags, current_target_tags) in zip(prediction_tags, target_tags):
-            if calculate_doc_scores:
-                doc_results = deepcopy(self.metric_schema)
-                doc_results_per_type = defaultdict(
-                    lambda: deepcopy(self.metric_schema))
-
-            predicted_named_entities = self._get_named_entities(current_prediction_tags)
-            true_named_entities = self._get_named_entities(current_target_tags)
-
+        for (predicted_named_entities, true_named_entities) in zip(batch_predicted_named_entities, batch_true_named_entities):
             if len(predicted_named_entities) == 0 and len(true_named_entities) == 0:
                 continue
 
-            seg_results, seg_results_per_type = self._compute_metrics(
+            seg_results, seg_entity_types, seg_results_per_type = self._compute_metrics(
                 true_named_entities, predicted_named_entities, main_entities)
 
             # accumulate overall stats
-            results, results_per_type = self._accumulate_stats(
-                results, results_per_type, seg_results, seg_results_per_type)
-
-            if calculate_doc_scores:
-                 # accumulate stats across documents
-                doc_results, doc_results_per_type = self._accumulate_stats(
-                    doc_results, doc_results_per_type, seg_results, seg_results_per_type)
-
-            for e_type in results_per_type:
-                if calculate_doc_scores:
-                    doc_results_per_type[e_type] = self._compute_precision_recall_wrapper(
-                        doc_results_per_type[e_type])
-
-                    results_per_type[e_type] = self._accumulate_doc_scores(
-                        results_per_type[e_type], doc_results_per_type[e_type]
-                    )
+            entity_type_indices = results.add_counts(
+                seg_results, seg_entity_types, seg_results_per_type)
 
             if calculate_doc_scores:
-                doc_results = self._compute_precision_recall_wrapper(doc_results)
-                results = self._accumulate_doc_scores(results, doc_results)
+                # every segment is scored as a separate document. Entity types which
+                # do not occur in the segment have no predictions and no annotations,
+                # so they would be dismissed anyway
+                for i, entity_type_idx in enumerate(entity_type_indices):
+                    self._accumulate_doc_scores(
+                        results, seg_results_per_type[i], entity_type_idx)
 
-        return results, results_per_type
+                self._accumulate_doc_scores(results, seg_results)
 
-    def _accumulate_doc_scores(self, results, doc_results):
+    def _accumulate_doc_scores(
+            self,
+            results: TagMetricCounts,
+            doc_counts: np.ndarray,
+            entity_type_idx: int = None):
         """Accumulate the scores (P, R, F1) across documents.
 
         When a entity does not occur in a particular document according to the gold standard,
         it is dismissed as it would artifically lower the final measure.
 
-        :param dict results: nested accumulator of scores across document.
-        :param dict doc_results: nested scores of current document.
-        :return: accumulator updated with the scores of current document.
-        :rtype: dict
+        :param TagMetricCounts results: accumulator of scores across document.
+        :param np.ndarray doc_counts: counts of current document per measure type.
+        :param int entity_type_idx: index of the entity type of the counts, if they are per type.
 
         """
 
-        for eval_schema in results:
-            actual = doc_results[eval_schema][TagMetric.Actual]
-            possible = doc_results[eval_schema][TagMetric.Possible]
-
-            # to compute precision dismiss documents for which no entities were predicted
-            if actual != 0:
-                results[eval_schema][TagMetric.PrecisionMacroDoc].append(
-                    doc_results[eval_schema][TagMetric.PrecisionMicro])
-
-            # to compute recall dismiss documents for which no entities exists in gold standard
-            if possible != 0:
-                results[eval_schema][TagMetric.RecallMacroDoc].append(
-                    doc_results[eval_schema][TagMetric.RecallMicro])
-
-            # to compute recall dismiss documents for which no entities exists in gold standard
-            if possible != 0 and actual != 0:
-                results[eval_schema][TagMetric.F1ScoreMacroDoc].append(
-                    doc_results[eval_schema][TagMetric.F1ScoreMicro])
-
-        return results
+        for measure_type_idx, measure_type_counts in enumerate(doc_counts.tolist()):
+            actual, possible, precision, recall, f1_score = self._compute_precision_recall(
+                measure_type_counts)
+
+            results.add_doc_scores(
+                measure_type_idx,
+                [
+                    # to compute precision dismiss documents for which no entities were predicted
+                    precision if actual != 0 else None,
+                    # to compute recall dismiss documents for which no entities exists in gold standard
+                    recall if possible != 0 else None,
+                    f1_score if possible != 0 and actual != 0 else None
+                ],
+                entity_type_idx)
 
     def add_predictions(
             self,
@@ -160,14 +131,25 @@ class TagMetricsService:
             target_tags,
             main_entities,
             entity_tag_type):
+        self.add_predicted_entities(
+            [self._get_named_entities(x) for x in prediction_tags],
+            [self._get_named_entities(x) for x in target_tags],
+            main_entities,
+            entity_tag_type)
+
+    def add_predicted_entities(
+            self,
+            predicted_named_entities,
+            true_named_entities,
+            main_entities,
+            entity_tag_type):
         if entity_tag_type not in self._results.keys():
             self.initialize(entity_tag_type)
 
-        self._results[entity_tag_type], self._results_per_type[entity_tag_type] = self._aggregate_batch(
+        self._aggregate_batch(
             self._results[entity_tag_type],
-            self._results_per_type[entity_tag_type],
-            prediction_tags,
-            target_tags,
+            predicted_named_entities,
+            true_named_entities,
             main_entities,
             calculate_doc_scores=True)
 
@@ -175,23 +157,72 @@ class TagMetricsService:
         result = {}
         for entity_tag_type in self._results.keys():
             result[entity_tag_type] = self._calculate_overall_stats(
-                self._results[entity_tag_type], self._results_per_type[entity_tag_type])
+                self._results[entity_tag_type])
 
         return result
 
-    def _calculate_overall_stats(self, results, results_per_type):
+    def _calculate_overall_stats(self, results: TagMetricCounts):
         # Compute overall metrics by entity type
-        for e_type in results_per_type:
-            results_per_type[e_type] = self._compute_precision_recall_wrapper(results_per_type[e_type])
-            results_per_type[e_type] = self._compute_macro_doc_scores(results_per_type[e_type])
+        results_per_type = {
+            e_type: self._create_results(
+                results.counts_per_type[i], results.doc_scores_per_type[i])
+            for i, e_type in enumerate(results.entity_types)
+        }
 
         # Compute overall metrics across entity types
-        results = self._compute_precision_recall_wrapper(results)
-        results = self._compute_macro_doc_scores(results)
-        results = self._compute_macro_type_scores(results, results_per_type)
+        overall_results = self._create_results(results.counts, results.doc_scores)
+        overall_results = self._compute_macro_type_scores(overall_results, results_per_type)
+
+        return overall_results, results_per_type
+
+    def _create_results(
+            self,
+            counts: np.ndarray,
+            doc_scores: List[List[List[float]]]):
+        """Create the nested results of accumulated counts.
+
+        In the entity type matching scenario (fuzzy),
+        overlapping entities and entities with strict boundary matches are rewarded equally
 
-        return results, results_per_type
+        :param np.ndarray counts: accumulated counts per measure type.
+        :param list doc_scores: accumulated document scores per measure type.
+        :return: results per measure type.
+        :rtype: dict
 
+        """
+
+        results = {}
+        for measure_type in [TagMeasureType.Partial, TagMeasureType.Strict]:
+            measure_type_idx = TagMetricCounts.measure_types.index(measure_type)
+            measure_type_counts = counts[measure_type_idx].tolist()
+            correct, incorrect, partial, missed, spurious = measure_type_counts
+
+            actual, possible, precision, recall, f1_score = self._compute_precision_recall(
+                measure_type_counts)
+
+            results[measure_type] = {
+                TagMetric.Correct: correct,
+                TagMetric.Incorrect: incorrect,
+                TagMetric.Partial: partial,
+                TagMetric.Missed: missed,
+                TagMetric.Spurious: spurious,
+                TagMetric.Possible: possible,
+                TagMetric.Actual: actual,
+                TagMetric.TruePositives: correct,
+                TagMetric.FalsePositives: actual - correct,
+                TagMetric.PrecisionMicro: precision,
+                TagMetric.RecallMicro: recall,
+                TagMetric.F1ScoreMicro: f1_score,
+                TagMetric.PrecisionMacroDoc: doc_scores[measure_type_idx][0],
+                TagMetric.RecallMacroDoc: doc_scores[measure_type_idx][1],
+                TagMetric.F1ScoreMacroDoc: doc_scores[measure_type_idx][2],
+                TagMetric.PrecisionMacro: 0,
+                TagMetric.RecallMacro: 0,
+                TagMetric.F1ScoreMacro: 0,
+            }
+
+        results = self._compute_macro_doc_scores(results)
+        return results
 
     def _compute_macro_doc_scores(self, results):
         """Compute the macro scores for Precision, Recall, F1 across documents.
@@ -265,68 +296,25 @@ class TagMetricsService:
 
         return results
 
-    def _accumulate_stats(self, results, results_per_type, tmp_results, tmp_results_per_type):
-        """Accumulate the scores across lines.
-
-        :param dict results: nested accumulator of scores across lines.
-        :param dict results_per_type: nested accumulator of scores per type across lines.
-        :param dict tmp_results: scores of current line.
-        :param dict tmp_results_per_type: scores of current line per type.
-        :return: updated accumulator across labels and per entity type.
-        :rtype: Tuple(dict, dict)
-
-        """
-
-        for eval_schema in results:
-            # Aggregate metrics across entity types
-            for metric in results[eval_schema]:
-                results[eval_schema][metric] += tmp_results[eval_schema][metric]
+    def _compute_precision_recall(self, counts: List[int]) -> Tuple[int, int, float, float, float]:
+        """ Compute the micro scores for Precision, Recall, F1.
 
-                # Aggregate metrics by entity type
-                for e_type in tmp_results_per_type:
-                    results_per_type[e_type][eval_schema][metric] += tmp_results_per_type[e_type][
-                        eval_schema
-                    ][metric]
+        Partial matches are rewarded with half of the reward of a correct match.
 
-        return results, results_per_type
+        :param list counts: evaluation counts of a measure type.
+        :return: actual, possible, precision, recall and F1
+        :rtype: Tuple(int, int, float, float, float)
 
-    def _compute_precision_recall_wrapper(self, results):
-        """
-        Wraps the compute_precision_recall function and runs it for each evaluation scenario in results
         """
 
-        results_a = {
-            key: self._compute_precision_recall(value, True)
-            for key, value in results.items()
-            if key in [TagMeasureType.Partial]
-        }
+        correct, incorrect, partial, missed, spurious = counts
 
-        # in the entity type matching scenario (fuzzy),
-        # overlapping entities and entities with strict boundary matches are rewarded equally
-        results_b = {
-            key: self._compute_precision_recall(value)
-            for key, value in results.items()
-            if key in [TagMeasureType.Strict]
-        }
-
-        results = {**results_a, **results_b}
-
-        return results
-
-    def _compute_precision_recall(self, results, partial=False):
-        """ Compute the micro scores for Precision, Recall, F1.
-
-        :param dict results: evaluation results.
-        :param bool partial: option to half the reward of partial matches.
-        :return: Description of returned object.
-        :rtype: updated results
-
-        """
+        # Possible: number annotations in the gold-standard which contribute to the
+        # final score
+        possible = correct + incorrect + partial + missed
 
-        actual = results[TagMetric.Actual]
-        possible = results[TagMetric.Possible]
-        partial = results[TagMetric.Partial]
-        correct = results[TagMetric.Correct]
+        # Actual: number of annotations produced by the NER system
+        actual = correct + incorrect + partial + spurious
 
         if partial:
             precision = (correct + 0.5 * partial) / actual if actual > 0 else 0
@@ -337,14 +325,12 @@ class TagMetricsService:
             precision = correct / actual if actual > 0 else 0
             recall = correct / possible if possible > 0 else 0
 
-        results[TagMetric.PrecisionMicro] = precision
-        results[TagMetric.RecallMicro] = recall
-        results[TagMetric.F1ScoreMicro] = (
+        f1_score = (
             2 * (precision * recall) / (precision +
                                         recall) if (precision + recall) > 0 else 0
         )
 
-        return results
+        return actual, possible, precision, recall, f1_score
 
     def _get_named_entities(self, prediction_tags):
         named_entities = []
@@ -387,250 +373,289 @@ class TagMetricsService:
 
         return named_entities
 
-    def _compute_metrics(self, true_named_entities: list, pred_named_entities: list, tags: set):
-        """Compute the metrics of segment for all evaluation scenarios.
+    def create_label_lookup(self, entities: np.ndarray, known_labels: np.ndarray) -> LabelLookup:
+        """Create the lookup arrays used to parse named entities directly from labels.
 
-        :param list(Entity) true_named_entities: nested list with entity annotations of gold standard.
-        :param list(Entity) pred_named_entities: nested list with entity annotations of system response.
-        :param set tags: limit to provided tags.
-        :return: nested results and results per entity type
-        :rtype: Tuple(dict, dict)
+        The tags are interpreted the same way as in `_get_named_entities`.
+
+        :param np.ndarray entities: the entity tag of every label.
+        :param np.ndarray known_labels: whether every label has an entity tag.
+        :return: per label whether it is known, outside of an entity, the beginning of an entity and its entity type.
+        :rtype: LabelLookup
 
         """
 
-        # overall results
-        evaluation = deepcopy(self.metric_schema)
+        labels_count = len(entities)
+        known = np.zeros(labels_count, dtype=np.bool_)
+        outside = np.zeros(labels_count, dtype=np.bool_)
+        begin = np.zeros(labels_count, dtype=np.bool_)
+        entity_type_ids = np.zeros(labels_count, dtype=np.int64)
+        entity_types = []
 
-        # results by entity type
-        evaluation_agg_entities_type = defaultdict(
-            lambda: deepcopy(self.metric_schema))
+        for label, entity in enumerate(entities):
+            if not known_labels[label] or not isinstance(entity, str):
+                continue
 
-        # keep track of entities that overlapped
-        true_which_overlapped_with_pred = []
+            known[label] = True
+            outside[label] = entity == "O"
+            begin[label] = entity[:1] == "B"
 
-        # Subset into only the tags that we are interested in.
-        # NOTE: we remove the tags we don't want from both the predicted and the
-        # true entities. This covers the two cases where mismatches can occur:
-        #
-        # 1) Where the model predicts a tag that is not present in the true data
-        # 2) Where there is a tag in the true data that the model is not capable of
-        # predicting.
+            if entity[2:] not in entity_types:
+                entity_types.append(entity[2:])
 
-        # only allow alternatives in prediction file, not in gold standard
-        true_named_entities = [ent[0]
-                               for ent in true_named_entities if ent[0].e_type in tags]
-        # pred_named_entities = [ent for ent in pred_named_entities if [ent[0]].e_type in tags]
-        pred_named_entities = [ent for ent in pred_named_entities if any(
-            [e.e_type in tags for e in ent])]
+            entity_type_ids[label] = entity_types.index(entity[2:])
 
-        # go through each predicted named-entity
-        for pred in pred_named_entities:
-            found_overlap = False
+        return LabelLookup(known, outside, begin, entity_type_ids, entity_types)
 
-            # Check each of the potential scenarios in turn. See
-            # http://www.davidsbatista.net/blog/2018/05/09/Named_Entity_Evaluation/
-            # for scenario explanation.
+    def get_named_entities_from_labels(
+            self,
+            labels: np.ndarray,
+            mask: np.ndarray,
+            label_lookup: LabelLookup):
+        """Get the named entities of every sequence of a batch of labels.
 
-            # Scenario I: Exact match between true and pred
-            for true_tag in true_named_entities:
-                if any(p == true_tag for p in pred):
-                    true_which_overlapped_with_pred.append(true_tag)
-                    evaluation[TagMeasureType.Strict][TagMetric.Correct] += 1
-                    evaluation[TagMeasureType.Partial][TagMetric.Correct] += 1
+        The result is the same as calling `_get_named_entities` with the tags of the labels
+        of each sequence which are not masked out.
 
-                    # aggregated by entity type results
-                    evaluation_agg_entities_type[true_tag.e_type][TagMeasureType.Strict][TagMetric.Correct] += 1
-                    evaluation_agg_entities_type[true_tag.e_type][TagMeasureType.Partial][TagMetric.Correct] += 1
+        :param np.ndarray labels: labels of the batch (batch_size x max_length).
+        :param np.ndarray mask: which labels are part of the sequences (batch_size x max_length).
+        :param LabelLookup label_lookup: lookup arrays of the labels.
+        :return: the nested named entities of every sequence.
+        :rtype: list
 
-                    break
+        """
+
+        sequence_indices, start_offsets, end_offsets, entity_type_ids = self.get_entity_spans(
+            labels, mask, label_lookup)
+
+        named_entities = [[] for _ in range(len(labels))]
+        for sequence_idx, start_offset, end_offset, entity_type_id in zip(
+                sequence_indices.tolist(),
+                start_offsets.tolist(),
+                end_offsets.tolist(),
+                entity_type_ids.tolist()):
+            named_entities[sequence_idx].append([
+                Entity(label_lookup.entity_types[entity_type_id], start_offset, end_offset)])
+
+        return named_entities
+
+    def get_entity_spans(
+            self,
+            labels: np.ndarray,
+            mask: np.ndarray,
+            label_lookup: LabelLookup) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Find the spans of all named entities of a batch of labels at once.
+
+        Masked out labels are dropped, so the offsets are positions among the remaining labels of a sequence.
+
+        :param np.ndarray labels: labels of the batch (batch_size x max_length).
+        :param np.ndarray mask: which labels are part of the sequences (batch_size x max_length).
+        :param LabelLookup label_lookup: lookup arrays of the labels.
+        :return: sequence index, start offset, end offset and entity type id of every named entity.
+        :rtype: Tuple(np.ndarray, np.ndarray, np.ndarray, np.ndarray)
 
-            else:
+        """
+
+        labels = np.asarray(labels, dtype=np.int64)
+        mask = np.asarray(mask, dtype=np.bool_)
+
+        # the labels of all sequences are concatenated
+        sequence_indices = np.nonzero(mask)[0]
+        labels = labels[mask]
 
-                # check for overlaps with any of the true entities
-                for true_tag in true_named_entities:
+        known_range = (labels >= 0) & (labels < len(label_lookup.known))
+        if not known_range.all() or not label_lookup.known[labels].all():
+            raise Exception('Entity not found for this label')
 
-                    # NOTE: error in original code: missing + 1
-                    # overlapping needs to take into account last token as well
-                    pred_range = range(
-                        pred[0].start_offset, pred[0].end_offset + 1)
-                    true_range = range(true_tag.start_offset,
-                                       true_tag.end_offset + 1)
+        sequence_lengths = mask.sum(axis=1)
+        sequence_starts = np.cumsum(sequence_lengths) - sequence_lengths
+        offsets = np.arange(len(labels)) - np.repeat(sequence_starts, sequence_lengths)
 
-                    # Scenario IV: Offsets match, but entity type is wrong
+        is_first = offsets == 0
+        is_last = np.ones(len(labels), dtype=np.bool_)
+        is_last[:-1] = sequence_indices[1:] != sequence_indices[:-1]
 
-                    if (
-                        true_tag.start_offset == pred[0].start_offset
-                        and pred[0].end_offset == true_tag.end_offset
-                        and true_tag.e_type != pred[0].e_type
-                    ):
+        inside = ~label_lookup.outside[labels]
+        entity_type_ids = label_lookup.entity_type_ids[labels]
 
-                        # overall results
-                        evaluation[TagMeasureType.Strict][TagMetric.Incorrect] += 1
-                        evaluation[TagMeasureType.Partial][TagMetric.Correct] += 1
+        # an entity starts after an outside tag, at a change of the entity type or at a begin tag
+        continues_previous = np.zeros(len(labels), dtype=np.bool_)
+        continues_previous[1:] = inside[:-1] & (entity_type_ids[1:] == entity_type_ids[:-1])
+        continues_previous &= ~is_first & ~label_lookup.begin[labels]
+        starts = inside & ~continues_previous
 
-                        # aggregated by entity type results
-                        evaluation_agg_entities_type[true_tag.e_type][TagMeasureType.Strict][TagMetric.Incorrect] += 1
-                        evaluation_agg_entities_type[true_tag.e_type][TagMeasureType.Partial][TagMetric.Correct] += 1
+        # and ends before the next label does not continue it
+        continued = np.zeros(len(labels), dtype=np.bool_)
+        continued[:-1] = inside[1:] & continues_previous[1:]
+        ends = inside & (is_last | ~continued)
 
-                        true_which_overlapped_with_pred.append(true_tag)
-                        found_overlap = True
+        start_indices = np.nonzero(starts)[0]
+        end_indices = np.nonzero(ends)[0]
 
-                        break
+        # an entity which goes up until the last label is only kept if it has a type and
+        # does not start at the first label, same as in `_get_named_entities`
+        entity_type_ids = entity_type_ids[start_indices]
+        has_entity_type = np.array(
+            [entity_type != '' for entity_type in label_lookup.entity_types], dtype=np.bool_)
+        keep = ~is_last[end_indices] | (
+            has_entity_type[entity_type_ids] & (offsets[start_indices] != 0))
 
-                    # check for an overlap, i.e. not exact boundary match, with true entities
-                    # NOTE: error in original code:
-                    # overlaps with true entities must only counted once
-                    elif (
-                        self._find_overlap(true_range, pred_range)
-                        and true_tag not in true_which_overlapped_with_pred
-                    ):
+        return (
+            sequence_indices[start_indices][keep],
+            offsets[start_indices][keep],
+            offsets[end_indices][keep],
+            entity_type_ids[keep])
+
+    def _compute_metrics(self, true_named_entities: list, pred_named_entities: list, tags: set):
+        """Compute the metrics of segment for all evaluation scenarios.
 
-                        true_which_overlapped_with_pred.append(true_tag)
-                        found_overlap = True
+        :param list(Entity) true_named_entities: nested list with entity annotations of gold standard.
+        :param list(Entity) pred_named_entities: nested list with entity annotations of system response.
+        :param set tags: limit to provided tags.
+        :return: counts, entity types in the order they were seen and counts per entity type
+        :rtype: Tuple(np.ndarray, list, np.ndarray)
 
-                        # Scenario V: There is an overlap (but offsets do not match
-                        # exactly), and the entity type is the same.
-                        # 2.1 overlaps with the same entity type
+        """
 
-                        if any(p.e_type == true_tag.e_type for p in pred):
+        # overall results
+        evaluation = TagMetricCounts.create_counts()
 
-                            # overall results
-                            evaluation[TagMeasureType.Strict][TagMetric.Incorrect] += 1
-                            evaluation[TagMeasureType.Partial][TagMetric.Partial] += 1
+        # results by entity type, every entity type that gets a count is one of the provided tags
+        entity_types = []
+        entity_type_indices = {}
+        evaluation_agg_entities_type = TagMetricCounts.create_counts(
+            number_of_entity_types=len(tags))
 
-                            # aggregated by entity type results
-                            evaluation_agg_entities_type[true_tag.e_type][TagMeasureType.Strict][TagMetric.Incorrect] += 1
-                            evaluation_agg_entities_type[true_tag.e_type][TagMeasureType.Partial][TagMetric.Partial] += 1
+        def add_count(e_type: str, strict_metric: int, partial_metric: int, overall: bool = True):
+            if overall:
+                evaluation[_strict, strict_metric] += 1
+                evaluation[_partial, partial_metric] += 1
 
-                            break
+            # aggregated by entity type results
+            if e_type not in entity_type_indices.keys():
+                entity_type_indices[e_type] = len(entity_types)
+                entity_types.append(e_type)
 
-                        # Scenario VI: Entities overlap, but the entity type is
-                        # different.
+            e_type_idx = entity_type_indices[e_type]
+            evaluation_agg_entities_type[e_type_idx, _strict, strict_metric] += 1
+            evaluation_agg_entities_type[e_type_idx, _partial, partial_metric] += 1
 
-                        else:
-                            # overall results
-                            evaluation[TagMeasureType.Strict][TagMetric.Incorrect] += 1
-                            evaluation[TagMeasureType.Partial][TagMetric.Partial] += 1
+        # Subset into only the tags that we are interested in.
+        # NOTE: we remove the tags we don't want from both the predicted and the
+        # true entities. This covers the two cases where mismatches can occur:
+        #
+        # 1) Where the model predicts a tag that is not present in the true data
+        # 2) Where there is a tag in the true data that the model is not capable of
+        # predicting.
 
-                            # aggregated by entity type results
-                            # Results against the true entity
+        # only allow alternatives in prediction file, not in gold standard
+        true_named_entities = [ent[0]
+                               for ent in true_named_entities if ent[0].e_type in tags]
+        # pred_named_entities = [ent for ent in pred_named_entities if [ent[0]].e_type in tags]
+        pred_named_entities = [ent for ent in pred_named_entities if any(
+            [e.e_type in tags for e in ent])]
 
-                            evaluation_agg_entities_type[true_tag.e_type][TagMeasureType.Strict][TagMetric.Incorrect] += 1
-                            evaluation_agg_entities_type[true_tag.e_type][TagMeasureType.Partial][TagMetric.Partial] += 1
+        # keep track of entities that overlapped
+        true_overlapped_with_pred = [False] * len(true_named_entities)
 
-                            break
+        # the true entities are parsed from a tag sequence, so they are sorted and do not overlap.
+        # Their end offsets are sorted as well, which allows finding the true entities that overlap
+        # with a prediction using a binary search instead of comparing against all of them
+        true_end_offsets = [true_tag.end_offset for true_tag in true_named_entities]
+        true_entity_indices = {}
+        for i, true_tag in enumerate(true_named_entities):
+            true_entity_indices.setdefault(true_tag, i)
 
-                # Scenario II: Entities are spurious (i.e., over-generated).
+        # go through each predicted named-entity
+        for pred in pred_named_entities:
+            # Check each of the potential scenarios in turn. See
+            # http://www.davidsbatista.net/blog/2018/05/09/Named_Entity_Evaluation/
+            # for scenario explanation.
 
-                if not found_overlap:
+            # Scenario I: Exact match between true and pred
+            exact_match_indices = [
+                true_entity_indices[p] for p in pred if p in true_entity_indices.keys()]
+            if len(exact_match_indices) > 0:
+                true_idx = min(exact_match_indices)
+                true_overlapped_with_pred[true_idx] = True
+                add_count(true_named_entities[true_idx].e_type, _correct, _correct)
+                continue
 
-                    # Overall results
-                    evaluation[TagMeasureType.Strict][TagMetric.Spurious] += 1
-                    evaluation[TagMeasureType.Partial][TagMetric.Spurious] += 1
+            found_overlap = False
 
-                    # Aggregated by entity type results
+            # check for overlaps with the true entities which end after the prediction starts
+            # and start before it ends
+            # NOTE: error in original code: missing + 1
+            # overlapping needs to take into account last token as well
+            true_idx = bisect_left(true_end_offsets, pred[0].start_offset)
+            while (
+                true_idx < len(true_named_entities)
+                and true_named_entities[true_idx].start_offset <= pred[0].end_offset
+            ):
+                true_tag = true_named_entities[true_idx]
 
-                    # NOTE: error in original code:
-                    # a spurious entity for a particular tag should be only
-                    # attributed to the respective tag
-                    if pred[0].e_type in tags:
-                        spurious_tags = [pred[0].e_type]
+                # Scenario IV: Offsets match, but entity type is wrong
 
-                    else:
-                        # NOTE: when pred.e_type is not found in tags
-                        # or when it simply does not appear in the test set, then it is
-                        # spurious, but it is not clear where to assign it at the tag
-                        # level. In this case, it is applied to all target_tags
-                        # found in this example. This will mean that the sum of the
-                        # evaluation_agg_entities will not equal evaluation.
+                if (
+                    true_tag.start_offset == pred[0].start_offset
+                    and pred[0].end_offset == true_tag.end_offset
+                    and true_tag.e_type != pred[0].e_type
+                ):
 
-                        spurious_tags = tags
+                    add_count(true_tag.e_type, _incorrect, _correct)
 
-                    for true_tag in spurious_tags:
-                        evaluation_agg_entities_type[true_tag][TagMeasureType.Strict][TagMetric.Spurious] += 1
-                        evaluation_agg_entities_type[true_tag][TagMeasureType.Partial][TagMetric.Spurious] += 1
+                    true_overlapped_with_pred[true_idx] = True
+                    found_overlap = True
 
-        # Scenario III: Entity was missed entirely.
+                    break
 
-        for true_tag in true_named_entities:
-            if true_tag not in true_which_overlapped_with_pred:
-                # overall results
-                evaluation[TagMeasureType.Strict][TagMetric.Missed] += 1
-                evaluation[TagMeasureType.Partial][TagMetric.Missed] += 1
-
-                # aggregated by entity type results
-                evaluation_agg_entities_type[true_tag.e_type][TagMeasureType.Strict][TagMetric.Missed] += 1
-                evaluation_agg_entities_type[true_tag.e_type][TagMeasureType.Partial][TagMetric.Missed] += 1
-
-        # Compute 'possible', 'actual' according to SemEval-2013 Task 9.1 on the
-        # overall results, and use these to calculate precision and recall.
-        for eval_type in evaluation:
-            # if eval_type != "slot_error_rate":
-            evaluation[eval_type] = self._compute_actual_possible(
-                evaluation[eval_type])
-
-        # Compute 'possible', 'actual', and precision and recall on entity level
-        # results. Start by cycling through the accumulated results.
-        for entity_type, entity_level in evaluation_agg_entities_type.items():
-
-            # Cycle through the evaluation types for each dict containing entity
-            # level results.
-            for eval_type in entity_level:
-                # if eval_type != "slot_error_rate":
-                evaluation_agg_entities_type[entity_type][eval_type] = self._compute_actual_possible(
-                    entity_level[eval_type]
-                )
-
-        return evaluation, evaluation_agg_entities_type
-
-    def _find_overlap(self, true_range, pred_range):
-        """Find the overlap between two ranges
-
-        Find the overlap between two ranges. Return the overlapping values if
-        present, else return an empty set().
-
-        Examples:
-
-        >>> _find_overlap((1, 2), (2, 3))
-        2
-        >>> _find_overlap((1, 2), (3, 4))
-        set()
-        """
+                # check for an overlap, i.e. not exact boundary match, with true entities
+                # NOTE: error in original code:
+                # overlaps with true entities must only counted once
+                elif not true_overlapped_with_pred[true_idx]:
 
-        true_set = set(true_range)
-        pred_set = set(pred_range)
+                    true_overlapped_with_pred[true_idx] = True
+                    found_overlap = True
 
-        overlaps = true_set.intersection(pred_set)
+                    # Scenario V: There is an overlap (but offsets do not match
+                    # exactly), and the entity type is the same.
+                    # Scenario VI: Entities overlap, but the entity type is
+                    # different.
+                    # Both are counted against the true entity
+                    add_count(true_tag.e_type, _incorrect, _partial_match)
 
-        return overlaps
+                    break
 
-    def _compute_actual_possible(self, results):
-        """Update the counts of possible and actual based on evaluation.
+                true_idx += 1
 
-        :param dict results: results with updated evaluation counts.
-        :return: the results dict with actual, possible updated.
-        :rtype: dict
+            # Scenario II: Entities are spurious (i.e., over-generated).
 
-        """
+            if not found_overlap:
 
-        correct = results[TagMetric.Correct]
-        incorrect = results[TagMetric.Incorrect]
-        partial = results[TagMetric.Partial]
-        missed = results[TagMetric.Missed]
-        spurious = results[TagMetric.Spurious]
+                # NOTE: error in original code:
+                # a spurious entity for a particular tag should be only
+                # attributed to the respective tag
+                if pred[0].e_type in tags:
+                    add_count(pred[0].e_type, _spurious, _spurious)
 
-        # Possible: number annotations in the gold-standard which contribute to the
-        # final score
-        possible = correct + incorrect + partial + missed
+                else:
+                    # NOTE: when pred.e_type is not found in tags
+                    # or when it simply does not appear in the test set, then it is
+                    # spurious, but it is not clear where to assign it at the tag
+                    # level. In this case, it is applied to all target_tags
+                    # found in this example. This will mean that the sum of the
+                    # evaluation_agg_entities will not equal evaluation.
 
-        # Actual: number of annotations produced by the NER system
-        actual = correct + incorrect + partial + spurious
+                    evaluation[:, _spurious] += 1
+                    for true_tag in tags:
+                        add_count(true_tag, _spurious, _spurious, overall=False)
 
-        results[TagMetric.Actual] = actual
-        results[TagMetric.Possible] = possible
+        # Scenario III: Entity was missed entirely.
 
-        results[TagMetric.TruePositives] = correct
-        results[TagMetric.FalsePositives] = actual - correct
-        results[TagMetric.FalseNegatives] = possible - correct
+        for true_idx, true_tag in enumerate(true_named_entities):
+            if not true_overlapped_with_pred[true_idx]:
+                add_count(true_tag.e_type, _missed, _missed)
 
-        return results
+        # 'possible', 'actual' and the precision and recall are computed from these counts
+        # according to SemEval-2013 Task 9.1 once the segments have been accumulated
+        return evaluation, entity_types, evaluation_agg_entities_type[:len(entity_types)]
@@ -1,7 +1,9 @@
 import os
+import time
 import numpy as np
+import torch
 
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 from models.model_base import ModelBase
 
@@ -13,6 +15,7 @@ from services.arguments.arguments_service_base import ArgumentsServiceBase
 from services.dataloader_service import DataLoaderService
 from services.evaluation.base_evaluation_service import BaseEvaluationService
 from services.file_service import FileService
+from services.log_service import LogService
 
 from utils.dict_utils import update_dictionaries
 
@@ -24,12 +27,14 @@ class TestService:
             dataloader_service: DataLoaderService,
             evaluation_service: BaseEvaluationService,
             file_service: FileService,
+            log_service: LogService,
             model: ModelBase):
 
         self._arguments_service = arguments_service
         self._evaluation_service = evaluation_service
         self._file_service = file_service
         self._dataloader_service = dataloader_service
+        self._log_service = log_service
 
         self._model = model.to(arguments_service.device)
 
@@ -38,6 +43,17 @@ class TestService:
         self._load_model()
         self._model.eval()
 
+        quantize_pretrained_model = self._arguments_service.quantize_pretrained_model
+        quantize_rnn_encoder = self._arguments_service.quantize_rnn_encoder
+        if quantize_pretrained_model or quantize_rnn_encoder:
+            if self._arguments_service.device != 'cpu':
+                raise Exception('Quantization is only supported on CPU')
+
+            if self._arguments_service.quantization_report:
+                self._report_quantization(quantize_pretrained_model, quantize_rnn_encoder)
+            else:
+                self._model.quantize(quantize_pretrained_model, quantize_rnn_encoder)
+
         evaluation: Dict[EvaluationType, List] = {}
         dataloader_length = len(self._dataloader)
 
@@ -56,6 +72,38 @@ class TestService:
 
         return self._evaluation_service.save_results(evaluation)
 
+    def _report_quantization(self, quantize_pretrained_model: bool, quantize_rnn_encoder: bool):
+        """
+        Quantize the model and log the difference in speed and metrics on the validation set
+        """
+        dataloader = self._dataloader_service.get_validation_dataloader()
+
+        full_precision_metrics, full_precision_time = self._evaluate_validation(dataloader)
+        self._model.quantize(quantize_pretrained_model, quantize_rnn_encoder)
+        quantized_metrics, quantized_time = self._evaluate_validation(dataloader)
+
+        self._log_service.log_info(
+            f'Quantization report [pre-trained model: {quantize_pretrained_model} | RNN encoder: {quantize_rnn_encoder}]')
+        self._log_service.log_info(
+            f'Forward time: {full_precision_time:.2f}s full precision, {quantized_time:.2f}s quantized [speed-up: {full_precision_time / quantized_time:.2f}x]')
+        for key, full_precision_value in full_precision_metrics.items():
+            quantized_value = quantized_metrics[key]
+            self._log_service.log_info(
+                f'{key}: {full_precision_value:.4f} full precision, {quantized_value:.4f} quantized [difference: {quantized_value - full_precision_value:+.4f}]')
+
+    def _evaluate_validation(self, dataloader) -> Tuple[Dict[str, float], float]:
+        forward_time = 0
+        with torch.no_grad():
+            for batch in dataloader:
+                start_time = time.perf_counter()
+                outputs = self._model.forward(batch)
+                forward_time += time.perf_counter() - start_time
+
+                self._model.calculate_accuracies(batch, outputs)
+
+        metrics = self._model.calculate_evaluation_metrics()
+        return metrics, forward_time
+
     def _load_model(self) -> ModelCheckpoint:
         checkpoints_path = self._file_service.get_checkpoints_path()
         model_checkpoint = self._model.load(checkpoints_path, 'BEST')
@@ -36,6 +36,9 @@ class BaseTokenizeService:
     def tokenize_sequences(self, sequences: List[str]) -> List[List[str]]:
         pass
 
+    def get_fingerprint(self) -> str:
+        pass
+
     @property
     def vocabulary_size(self) -> int:
         return 0
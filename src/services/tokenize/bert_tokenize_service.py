@@ -36,6 +36,7 @@ class BERTTokenizeService(BaseTokenizeService):
             raise Exception(f'Vocabulary not found in {vocabulary_path}')
 
         self._tokenizer: BertWordPieceTokenizer = BertWordPieceTokenizer(vocabulary_path, lowercase=False)
+        self._vocabulary_path = vocabulary_path
 
 
     @overrides
@@ -73,6 +74,10 @@ class BERTTokenizeService(BaseTokenizeService):
         encoded_representations = self._tokenizer.encode_batch(sequences)
         return [(x.ids, x.tokens, x.offsets, x.special_tokens_mask) for x in encoded_representations]
 
+    @overrides
+    def get_fingerprint(self) -> str:
+        return self._file_service.get_file_fingerprint(self._vocabulary_path)
+
     @property
     @overrides
     def vocabulary_size(self) -> int:
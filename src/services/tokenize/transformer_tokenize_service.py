@@ -1,4 +1,6 @@
 import os
+import json
+import hashlib
 
 from typing import Tuple, List
 
@@ -61,6 +63,11 @@ class TransformerTokenizeService(BaseTokenizeService):
         encoded_representations = self._tokenizer.encode_plus(sequences)
         return [(x.ids, x.tokens, x.offsets, x.special_tokens_mask) for x in encoded_representations]
 
+    @overrides
+    def get_fingerprint(self) -> str:
+        vocabulary = sorted(self._tokenizer.get_vocab().items(), key=lambda x: x[1])
+        return hashlib.sha1(json.dumps(vocabulary).encode('utf-8')).hexdigest()
+
     @property
     @overrides
     def vocabulary_size(self) -> int:
@@ -0,0 +1,26 @@
+import torch
+
+
+def scatter_mean(
+        values: torch.Tensor,
+        indices: torch.Tensor,
+        output_size: int) -> torch.Tensor:
+    """
+    Average the rows of `values` which share the same index.
+    Rows with a negative index are ignored and output rows without any values are left as zeros.
+    :param values: (number_of_rows x ...)
+    :param indices: output row of every input row (number_of_rows)
+    :param output_size: number of output rows
+    :return: (output_size x ...)
+    """
+    valid_rows = indices >= 0
+    values = values[valid_rows]
+    indices = indices[valid_rows]
+
+    result = torch.zeros(
+        (output_size,) + values.shape[1:], dtype=values.dtype, device=values.device)
+    result.index_add_(0, indices, values)
+
+    counts = torch.bincount(indices, minlength=output_size).clamp(min=1)
+    result = result / counts.view((output_size,) + (1,) * (values.dim() - 1)).to(values.dtype)
+    return result